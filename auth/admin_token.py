@@ -0,0 +1,78 @@
+import asyncio
+import time
+import logging
+from fastapi import HTTPException
+from auth.keycloak_client import get_keycloak_client, raise_for_keycloak_outage
+from config.settings import KEYCLOAK_ADMIN, KEYCLOAK_ADMIN_PASSWORD, KEYCLOAK_ADMIN_TOKEN_EXPIRY_MARGIN
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN_URL = "/realms/master/protocol/openid-connect/token"
+
+
+class AdminTokenCache:
+    """
+    Keeps the master-realm admin token in memory until shortly before it expires.
+    Renewal uses the refresh_token while it is still valid, otherwise a password grant,
+    and concurrent callers all await the same in-flight renewal.
+    """
+
+    def __init__(self):
+        self._access_token = None
+        self._expires_at = 0.0
+        self._refresh_token = None
+        self._refresh_expires_at = 0.0
+        self._renewal = None
+
+    async def get(self) -> str:
+        if self._access_token and time.monotonic() < self._expires_at:
+            return self._access_token
+
+        if self._renewal is None:
+            self._renewal = asyncio.ensure_future(self._renew())
+        # shield so a cancelled request doesn't cancel the renewal other callers wait on
+        return await asyncio.shield(self._renewal)
+
+    # drop a token Keycloak rejected (revoked, or the realm keys rotated) so the next get() renews it
+    def invalidate(self):
+        self._access_token = None
+        self._expires_at = 0.0
+
+    async def _renew(self) -> str:
+        try:
+            payload = None
+            if self._refresh_token and time.monotonic() < self._refresh_expires_at:
+                payload = await self._request({
+                    "grant_type": "refresh_token",
+                    "client_id": "admin-cli",
+                    "refresh_token": self._refresh_token,
+                })
+            if payload is None:
+                payload = await self._request({
+                    "grant_type": "password",
+                    "client_id": "admin-cli",
+                    "username": KEYCLOAK_ADMIN,
+                    "password": KEYCLOAK_ADMIN_PASSWORD,
+                })
+                if payload is None:
+                    raise HTTPException(status_code=500, detail="Keycloak admin authentication failed")
+
+            now = time.monotonic()
+            self._access_token = payload["access_token"]
+            self._expires_at = now + payload.get("expires_in", 60) - KEYCLOAK_ADMIN_TOKEN_EXPIRY_MARGIN
+            self._refresh_token = payload.get("refresh_token")
+            self._refresh_expires_at = now + payload.get("refresh_expires_in", 0) - KEYCLOAK_ADMIN_TOKEN_EXPIRY_MARGIN
+            return self._access_token
+        finally:
+            self._renewal = None
+
+    async def _request(self, data: dict) -> dict | None:
+        response = await get_keycloak_client().post(ADMIN_TOKEN_URL, data=data)
+        raise_for_keycloak_outage(response)
+        if response.status_code != 200:
+            logger.error(f"Keycloak auth failed ({data['grant_type']} grant): {response.text}")
+            return None
+        return response.json()
+
+
+admin_token_cache = AdminTokenCache()
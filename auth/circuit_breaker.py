@@ -0,0 +1,195 @@
+import asyncio
+import random
+import time
+import logging
+import httpx
+from config.settings import (
+    KEYCLOAK_CB_FAILURE_THRESHOLD,
+    KEYCLOAK_CB_RESET_SECONDS,
+    KEYCLOAK_CB_HALF_OPEN_PROBES,
+    KEYCLOAK_MAX_RETRIES,
+    KEYCLOAK_RETRY_BACKOFF_SECONDS,
+    KEYCLOAK_RETRY_BUDGET_RATIO,
+    KEYCLOAK_RETRY_BUDGET_MIN_PER_SECOND,
+)
+
+logger = logging.getLogger(__name__)
+
+# responses that count as Keycloak being unhealthy (and are worth retrying)
+UNHEALTHY_STATUSES = {500, 502, 503, 504}
+# methods safe to resend after the request may have reached Keycloak
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS"}
+# the retry bucket holds at most this many seconds worth of MIN_PER_SECOND retries
+RETRY_BUDGET_WINDOW_SECONDS = 10
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without calling Keycloak while the circuit is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Keycloak circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class KeycloakOverloadedError(httpx.TransportError):
+    """Raised without calling Keycloak when no in-flight slot frees up in time."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many Keycloak calls in flight")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    closed: calls pass, consecutive failures are counted.
+    open: calls fail fast with CircuitOpenError for KEYCLOAK_CB_RESET_SECONDS.
+    half-open: up to KEYCLOAK_CB_HALF_OPEN_PROBES calls probe Keycloak; a success closes
+    the circuit, a failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float, half_open_probes: int):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.half_open_probes = half_open_probes
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == "open" and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def before_request(self):
+        if self.state == "open":
+            remaining = self.reset_seconds - (time.monotonic() - self._opened_at)
+            if remaining > 0:
+                raise CircuitOpenError(remaining)
+            self.state = "half-open"
+            self._probes = 0
+            logger.warning("🟡 Keycloak circuit half-open, probing")
+
+        if self.state == "half-open":
+            if self._probes >= self.half_open_probes:
+                raise CircuitOpenError(1)
+            self._probes += 1
+
+    def record_success(self):
+        if self.state == "half-open":
+            logger.info("🟢 Keycloak circuit closed")
+        self.state = "closed"
+        self._failures = 0
+        self._probes = 0
+
+    def record_cancelled(self):
+        # a cancelled probe gives its slot back instead of wedging the half-open state
+        if self.state == "half-open" and self._probes:
+            self._probes -= 1
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == "half-open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.error(f"🔴 Keycloak circuit opened after {self._failures} failure(s)")
+            self.state = "open"
+            self._opened_at = time.monotonic()
+            self._probes = 0
+
+
+class RetryBudget:
+    """Token bucket that caps retries at a fraction of traffic, so retries can't multiply an outage."""
+
+    def __init__(self, ratio: float, min_per_second: float):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.capacity = max(1.0, min_per_second * RETRY_BUDGET_WINDOW_SECONDS)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def deposit(self):
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport with the circuit breaker and budgeted, jittered retries."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, breaker: CircuitBreaker, budget: RetryBudget):
+        self._transport = transport
+        self._breaker = breaker
+        self._budget = budget
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self._budget.deposit()
+        attempt = 0
+        while True:
+            attempt += 1
+            self._breaker.before_request()
+            try:
+                response = await self._transport.handle_async_request(request)
+            except asyncio.CancelledError:
+                self._breaker.record_cancelled()
+                raise
+            except httpx.TransportError as e:
+                self._breaker.record_failure()
+                # connect failures never reached Keycloak, so any method may be resent
+                resendable = request.method in IDEMPOTENT_METHODS or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not self._may_retry(attempt, resendable):
+                    raise
+                logger.warning(f"🔁 Retrying Keycloak {request.method} {request.url.path} after {type(e).__name__}")
+            else:
+                if response.status_code not in UNHEALTHY_STATUSES:
+                    self._breaker.record_success()
+                    return response
+                self._breaker.record_failure()
+                if not self._may_retry(attempt, request.method in IDEMPOTENT_METHODS):
+                    return response
+                await response.aclose()
+                logger.warning(f"🔁 Retrying Keycloak {request.method} {request.url.path} after {response.status_code}")
+
+            delay = KEYCLOAK_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            await asyncio.sleep(random.uniform(0, delay))
+
+    def _may_retry(self, attempt: int, resendable: bool) -> bool:
+        return resendable and attempt <= KEYCLOAK_MAX_RETRIES and not self._breaker.is_open and self._budget.withdraw()
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class AdmissionTransport(httpx.AsyncBaseTransport):
+    """Caps concurrent Keycloak calls; callers wait up to `timeout` for a slot, then are shed."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_in_flight: int, timeout: float):
+        self._transport = transport
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._timeout = timeout
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self._timeout)
+        except asyncio.TimeoutError:
+            raise KeycloakOverloadedError(retry_after=1)
+        try:
+            return await self._transport.handle_async_request(request)
+        finally:
+            self._slots.release()
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+keycloak_breaker = CircuitBreaker(KEYCLOAK_CB_FAILURE_THRESHOLD, KEYCLOAK_CB_RESET_SECONDS, KEYCLOAK_CB_HALF_OPEN_PROBES)
+keycloak_retry_budget = RetryBudget(KEYCLOAK_RETRY_BUDGET_RATIO, KEYCLOAK_RETRY_BUDGET_MIN_PER_SECOND)
@@ -1,8 +1,11 @@
-import os
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models.user_model import User
-from config.settings import KEYCLOAK_URL, KEYCLOAK_REALM
+from config.settings import KEYCLOAK_REALM, KEYCLOAK_TOKEN_VERIFICATION, KEYCLOAK_USERINFO_FALLBACK
+from auth.keycloak_client import get_keycloak_client, keycloak_unavailable, raise_for_keycloak_outage
+from auth.admin_token import admin_token_cache
+from redis_cache.user_id_cache import user_id_cache
+from auth.token_verifier import verify_access_token, TokenVerificationError, OpaqueTokenError, KeycloakMetadataError
 from utils.pswd_pattern import validate_password_pattern
 import logging 
 import httpx
@@ -10,20 +13,57 @@ import httpx
 token_scheme = HTTPBearer()
 
 logger = logging.getLogger(__name__)
+# one line per authenticated request; sampled via LOG_SAMPLE_RATES
+authorized_logger = logging.getLogger(f"{__name__}.authorized")
 
 # validate the given user with the access_token
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(token_scheme)):
     token = credentials.credentials
 
-    url = f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/userinfo"
+    if KEYCLOAK_TOKEN_VERIFICATION != "local":
+        return await fetch_userinfo(token)
+
+    try:
+        user_info = await verify_access_token(token)
+    except OpaqueTokenError:
+        if not KEYCLOAK_USERINFO_FALLBACK:
+            logger.error("Unauthorized: opaque token and /userinfo fallback is disabled")
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Unauthorized: Token invalid or expired."
+            )
+        return await fetch_userinfo(token)
+    except TokenVerificationError as e:
+        logger.error(f"Unauthorized: Token invalid or expired. {e}")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Unauthorized: Token invalid or expired. {e}"
+        )
+    except (httpx.HTTPError, KeycloakMetadataError) as e:
+        logger.error(f"🔌 Could not load Keycloak signing keys: {str(e)}")
+        raise keycloak_unavailable(e)
+
+    if "preferred_username" not in user_info:
+        logger.error(f"Invalid token payload: missing 'preferred_username'")
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload: missing 'preferred_username'"
+        )
+
+    authorized_logger.info("✅ Authorized user: %s", user_info["preferred_username"])
+    return user_info
+
+
+# validate the access_token through Keycloak's /userinfo (works for opaque tokens too)
+async def fetch_userinfo(token: str) -> dict:
+    url = f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/userinfo"
     headers = {"Authorization": f"Bearer {token}"}
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, headers=headers)
+        response = await get_keycloak_client().get(url, headers=headers)
 
-        logger.info(f"[Keycloak] /userinfo status: {response.status_code}")
-        logger.debug(f"[Keycloak] /userinfo response: {response.text}")
+        logger.debug("[Keycloak] /userinfo status: %s", response.status_code)
+        raise_for_keycloak_outage(response)
 
         if response.status_code != 200:
             logger.error(f"Unauthorized: Token invalid or expired. {response.text}")
@@ -42,15 +82,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(t
                 detail="Invalid token payload: missing 'preferred_username'"
             )
 
-        logger.info(f"✅ Authorized user: {user_info['preferred_username']}")
+        authorized_logger.info("✅ Authorized user: %s", user_info["preferred_username"])
         return user_info
 
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Keycloak unavailable. Try again later."
-        )
+        raise keycloak_unavailable(e)
     except Exception as e:
         logger.error(f"❌ Unexpected error in auth: {str(e)}")
         raise HTTPException(
@@ -59,73 +98,78 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(t
         )
     
 
-# get user id
+# get user id (cached, ids never change for a username)
 async def get_user_id(token, username):
-    url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users"
+    user_id = await user_id_cache.get(username)
+    if user_id:
+        return user_id
+
+    url = f"/admin/realms/{KEYCLOAK_REALM}/users"
     headers = {"Authorization": f"Bearer {token}"}
     params = {"username": username}
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            users = response.json()
-
-            exact_users = [
-                user for user in users if user.get("username", "").lower() == username.lower()
-            ]
-
-            if exact_users:
-                user_id = exact_users[0]['id']
-                logger.info(f"✅ User ID fetched for user: {username} - ID: {user_id}")
-                return user_id
-            else:
-                logger.error(f"❌ User '{username}' not found in Keycloak.")
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"User '{username}' not found in Keycloak."
-                )
+    response = await get_keycloak_client().get(url, headers=headers, params=params)
+    raise_for_keycloak_outage(response)
+    if response.status_code == 200:
+        users = response.json()
+
+        exact_users = [
+            user for user in users if user.get("username", "").lower() == username.lower()
+        ]
+
+        if exact_users:
+            user_id = exact_users[0]['id']
+            logger.info("✅ User ID fetched for user: %s - ID: %s", username, user_id)
+            await user_id_cache.set(username, user_id)
+            return user_id
         else:
-            logger.error(f"❌ Failed to fetch user ID for '{username}'. Status: {response.status_code}: {response.text}")
-            raise HTTPException(status_code=response.status_code, detail="Failed to fetch user info from Keycloak")
+            logger.error(f"❌ User '{username}' not found in Keycloak.")
+            raise HTTPException(
+                status_code=404,
+                detail=f"User '{username}' not found in Keycloak."
+            )
+    else:
+        logger.error(f"❌ Failed to fetch user ID for '{username}'. Status: {response.status_code}: {response.text}")
+        raise HTTPException(status_code=response.status_code, detail="Failed to fetch user info from Keycloak")
 
 
-# get admin token
+# get admin token (cached until shortly before expiry)
 async def get_admin_token():
-    async with httpx.AsyncClient() as client:
-        url = f"{KEYCLOAK_URL}/realms/master/protocol/openid-connect/token"
-        data = {
-            "grant_type": "password",
-            "client_id": "admin-cli",
-            "username": os.getenv("KEYCLOAK_ADMIN"),
-            "password": os.getenv("KEYCLOAK_ADMIN_PASSWORD")
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, data=data)
-            if response.status_code != 200:
-                logger.error(f"Keycloak auth failed: {response.text}")
-                raise HTTPException(status_code=500, detail=response.text)
-            return response.json()["access_token"]
+    return await admin_token_cache.get()
 
 
 # check user already exist in keycloak
 async def keycloak_user_exists(username: str) -> bool:
+    url = f"/admin/realms/{KEYCLOAK_REALM}/users"
+    for attempt in range(2):
+        headers = {"Authorization": f"Bearer {await get_admin_token()}"}
+        response = await get_keycloak_client().get(url, headers=headers, params={"username": username})
+        # a revoked or stale cached admin token; renew it and ask once more
+        if response.status_code != 401 or attempt:
+            break
+        admin_token_cache.invalidate()
+
+    raise_for_keycloak_outage(response)
+    if response.status_code != 200:
+        logger.error(f"❌ Failed to check user '{username}' in Keycloak. Status: {response.status_code}: {response.text}")
+        raise HTTPException(status_code=502, detail="Failed to check user in Keycloak")
+    return bool(response.json())
+
+
+# one page of realm users (username/id only), in Keycloak's listing order
+async def list_keycloak_users(first: int, max_results: int) -> list[dict]:
     token = await get_admin_token()
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token}"}
-        url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users?username={username}"
-        response = await client.get(url, headers=headers)
-        return bool(response.json())
+    headers = {"Authorization": f"Bearer {token}"}
+    url = f"/admin/realms/{KEYCLOAK_REALM}/users"
+    params = {"first": first, "max": max_results, "briefRepresentation": "true"}
+    response = await get_keycloak_client().get(url, headers=headers, params=params)
+    response.raise_for_status()
+    return response.json()
 
 
-# store user data in keycloak 
-async def sync_user_to_keycloak(user_data: User):
-    token = await get_admin_token()       # get token from admin to add user in keycloak
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    payload = {
+# keycloak representation of a postgres user
+def keycloak_user_payload(user_data: User) -> dict:
+    return {
         "username": user_data.username,
         "email": user_data.email,
         "enabled": True,
@@ -140,60 +184,105 @@ async def sync_user_to_keycloak(user_data: User):
         # }]  
     }
 
-    async with httpx.AsyncClient() as client:
-
-        # check_username_url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users?username={user_data.username}"
-        # response_username = await client.get(check_username_url, headers=headers)
-        # if response_username.status_code != 200:
-        #     raise HTTPException(status_code=500, detail="Failed to check username in Keycloak")
-        # if response_username.json():
-        #     raise HTTPException(status_code=400, detail="Username already exists in Keycloak")
-
-        # # Check for existing email
-        # check_email_url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users?email={user_data.email}"
-        # response_email = await client.get(check_email_url, headers=headers)
-        # if response_email.status_code != 200:
-        #     raise HTTPException(status_code=500, detail="Failed to check email in Keycloak")
-        # if response_email.json():
-        #     raise HTTPException(status_code=400, detail="Email already exists in Keycloak")
-        
-        
-        url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users"
-        response = await client.post(url, json=payload, headers=headers)
-        if response.status_code not in (201, 204):
-            logger.error(f"❌ Keycloak response: {response.status_code} - {response.text}")
-            raise HTTPException(status_code=response.status_code, detail="Failed to create user in Keycloak")
+
+# store user data in keycloak 
+async def sync_user_to_keycloak(user_data: User):
+    token = await get_admin_token()       # get token from admin to add user in keycloak
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    payload = keycloak_user_payload(user_data)
+
+    client = get_keycloak_client()
+
+    # check_username_url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users?username={user_data.username}"
+    # response_username = await client.get(check_username_url, headers=headers)
+    # if response_username.status_code != 200:
+    #     raise HTTPException(status_code=500, detail="Failed to check username in Keycloak")
+    # if response_username.json():
+    #     raise HTTPException(status_code=400, detail="Username already exists in Keycloak")
+
+    # # Check for existing email
+    # check_email_url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users?email={user_data.email}"
+    # response_email = await client.get(check_email_url, headers=headers)
+    # if response_email.status_code != 200:
+    #     raise HTTPException(status_code=500, detail="Failed to check email in Keycloak")
+    # if response_email.json():
+    #     raise HTTPException(status_code=400, detail="Email already exists in Keycloak")
+    
+    
+    url = f"/admin/realms/{KEYCLOAK_REALM}/users"
+    response = await client.post(url, json=payload, headers=headers)
+    if response.status_code not in (201, 204):
+        logger.error(f"❌ Keycloak response: {response.status_code} - {response.text}")
+        raise HTTPException(status_code=response.status_code, detail="Failed to create user in Keycloak")
+
+    # Location: .../admin/realms/{realm}/users/{id}
+    location = response.headers.get("Location")
+    if location:
+        await user_id_cache.set(user_data.username, location.rstrip("/").rsplit("/", 1)[-1])
     
     logger.info(f"✅ User {user_data.username} data is stored in keycloak")
 
+
+# store many users in keycloak with one partialImport call, existing users are skipped
+# returns the import result per (lowercased) username, e.g. {"action": "ADDED", "id": "..."}
+async def import_users_to_keycloak(users: list[User]) -> dict:
+    token = await get_admin_token()
+    headers = {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+    payload = {
+        "ifResourceExists": "SKIP",
+        "users": [keycloak_user_payload(user) for user in users]
+    }
+
+    url = f"/admin/realms/{KEYCLOAK_REALM}/partialImport"
+    response = await get_keycloak_client().post(url, json=payload, headers=headers)
+    if response.status_code != 200:
+        logger.error(f"❌ Keycloak partialImport response: {response.status_code} - {response.text}")
+        raise HTTPException(status_code=response.status_code, detail="Failed to import users into Keycloak")
+
+    body = response.json()
+    logger.info(f"✅ Keycloak partialImport: added={body.get('added')} skipped={body.get('skipped')}")
+    results = {
+        result["resourceName"].lower(): result
+        for result in body.get("results", [])
+        if result.get("resourceType") == "USER"
+    }
+    for username, result in results.items():
+        if result.get("action") == "ADDED" and result.get("id"):
+            await user_id_cache.set(username, result["id"])
+    return results
+
       
 # Reset user password in Keycloak
 async def reset_user_password(username: str, new_password: str):
     await validate_password_pattern(new_password)
     token = await get_admin_token()
     
-    # Get user ID by username
-    async with httpx.AsyncClient() as client:
-        headers = {"Authorization": f"Bearer {token}"}
-        url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users?username={username}"
-        response = await client.get(url, headers=headers)
-
-        if response.status_code != 200 or not response.json():
-            raise HTTPException(status_code=404, detail="User not found in Keycloak")
-
-        user_id = response.json()[0]["id"]
-
-        # Reset password (permanent)
-        reset_payload = {
-            "type": "password",
-            "value": new_password,
-            "temporary": False
-        }
-
-        reset_url = f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users/{user_id}/reset-password"
-        reset_response = await client.put(reset_url, headers=headers, json=reset_payload)
-
-        if reset_response.status_code != 204:
-            raise HTTPException(status_code=reset_response.status_code, detail="Failed to reset password in Keycloak")
-        
-        return {"status": "success", "message": f"Password reset for {username}"}
+    headers = {"Authorization": f"Bearer {token}"}
+
+    # Reset password (permanent)
+    reset_payload = {
+        "type": "password",
+        "value": new_password,
+        "temporary": False
+    }
+
+    # Get user ID by username; a 404 means a stale cached id, so look it up again once
+    for attempt in range(2):
+        user_id = await get_user_id(token, username)
+        reset_url = f"/admin/realms/{KEYCLOAK_REALM}/users/{user_id}/reset-password"
+        reset_response = await get_keycloak_client().put(reset_url, headers=headers, json=reset_payload)
+        if reset_response.status_code != 404:
+            break
+        await user_id_cache.invalidate(username)
+
+    raise_for_keycloak_outage(reset_response)
+    if reset_response.status_code != 204:
+        raise HTTPException(status_code=reset_response.status_code, detail="Failed to reset password in Keycloak")
+    
+    return {"status": "success", "message": f"Password reset for {username}"}
@@ -0,0 +1,152 @@
+import time
+import logging
+import httpx
+from fastapi import HTTPException, status
+from auth.circuit_breaker import (
+    ResilientTransport,
+    AdmissionTransport,
+    CircuitOpenError,
+    KeycloakOverloadedError,
+    keycloak_breaker,
+    keycloak_retry_budget,
+)
+from config.settings import (
+    KEYCLOAK_URL,
+    KEYCLOAK_HTTP_MAX_CONNECTIONS,
+    KEYCLOAK_HTTP_MAX_KEEPALIVE,
+    KEYCLOAK_HTTP_KEEPALIVE_EXPIRY,
+    KEYCLOAK_HTTP_TIMEOUT,
+    KEYCLOAK_HTTP_CONNECT_TIMEOUT,
+    KEYCLOAK_HTTP_POOL_TIMEOUT,
+    KEYCLOAK_HTTP2,
+    KEYCLOAK_MAX_IN_FLIGHT,
+    KEYCLOAK_ADMISSION_TIMEOUT,
+)
+from utils.metrics import KEYCLOAK_REQUEST_SECONDS, KEYCLOAK_REQUEST_ERRORS
+from utils.timeline import record_span
+
+logger = logging.getLogger(__name__)
+
+# one pooled client for all Keycloak traffic, opened/closed by the app lifespan
+_client: httpx.AsyncClient | None = None
+
+
+class KeycloakServerError(httpx.RequestError):
+    """Keycloak answered 5xx (after the transport's retries ran out): it is unavailable, not refusing."""
+
+    def __init__(self, response: httpx.Response):
+        super().__init__(f"Keycloak returned {response.status_code}", request=response.request)
+        self.status_code = response.status_code
+        retry_after = response.headers.get("Retry-After", "")
+        self.retry_after = float(retry_after) if retry_after.isdigit() else 1
+
+
+# a 5xx that survived the retries means Keycloak is down; callers map it to 503 like a connection error
+def raise_for_keycloak_outage(response: httpx.Response):
+    if response.status_code >= 500:
+        raise KeycloakServerError(response)
+
+
+# metric label for a Keycloak call, derived from its method and path
+def keycloak_operation(method: str, path: str) -> str:
+    if path.endswith("/userinfo"):
+        return "userinfo"
+    if path.endswith("/token"):
+        return "token"
+    if path.endswith("/logout"):
+        return "logout"
+    if "/.well-known/" in path or path.endswith("/certs"):
+        return "jwks"
+    if path.endswith("/partialImport"):
+        return "partial_import"
+    if path.endswith("/reset-password"):
+        return "reset_password"
+    if path.endswith("/execute-actions-email"):
+        return "execute_actions_email"
+    if path.endswith("/users"):
+        return "admin_search" if method == "GET" else "create_user"
+    return "other"
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Records latency and errors per Keycloak operation."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        operation = keycloak_operation(request.method, request.url.path)
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except httpx.TransportError as e:
+            KEYCLOAK_REQUEST_ERRORS.labels(operation=operation, error=type(e).__name__).inc()
+            raise
+        finally:
+            ended = time.perf_counter()
+            KEYCLOAK_REQUEST_SECONDS.labels(operation=operation).observe(ended - started)
+            record_span("keycloak", operation, started, ended)
+        if response.status_code >= 500:
+            KEYCLOAK_REQUEST_ERRORS.labels(operation=operation, error=str(response.status_code)).inc()
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+# `transport` replaces the network transport, e.g. an httpx.ASGITransport to an in-process stub
+def create_keycloak_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=KEYCLOAK_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=KEYCLOAK_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=KEYCLOAK_HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        KEYCLOAK_HTTP_TIMEOUT,
+        connect=KEYCLOAK_HTTP_CONNECT_TIMEOUT,
+        pool=KEYCLOAK_HTTP_POOL_TIMEOUT,
+    )
+    # admission sits outside the breaker, so shed calls never count as Keycloak failures
+    transport = InstrumentedTransport(AdmissionTransport(
+        ResilientTransport(
+            transport or httpx.AsyncHTTPTransport(limits=limits, http2=KEYCLOAK_HTTP2),
+            keycloak_breaker,
+            keycloak_retry_budget,
+        ),
+        KEYCLOAK_MAX_IN_FLIGHT,
+        KEYCLOAK_ADMISSION_TIMEOUT,
+    ))
+    return httpx.AsyncClient(base_url=KEYCLOAK_URL, timeout=timeout, transport=transport)
+
+
+async def start_keycloak_client(transport: httpx.AsyncBaseTransport | None = None):
+    global _client
+    if _client is None:
+        _client = create_keycloak_client(transport)
+        logger.info(f"🔌 Keycloak HTTP client started for {KEYCLOAK_URL} (http2={KEYCLOAK_HTTP2})")
+
+
+async def close_keycloak_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("🔌 Keycloak HTTP client closed")
+
+
+def get_keycloak_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("Keycloak HTTP client is not started; call start_keycloak_client() first")
+    return _client
+
+
+# 503 for a Keycloak connection failure or 5xx; an open circuit also tells the client when to come back
+def keycloak_unavailable(error: Exception) -> HTTPException:
+    headers = None
+    if isinstance(error, (CircuitOpenError, KeycloakOverloadedError, KeycloakServerError)):
+        headers = {"Retry-After": str(max(1, round(error.retry_after)))}
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Keycloak unavailable. Try again later.",
+        headers=headers,
+    )
@@ -0,0 +1,50 @@
+import logging
+import math
+from fastapi import HTTPException, Request, status
+from redis_cache.rate_limiter import hit, parse_limit
+from utils.metrics import RATE_LIMITED_REQUESTS
+from config.settings import RATE_LIMIT_ENABLED, RATE_LIMIT_TRUST_FORWARDED_FOR
+
+logger = logging.getLogger(__name__)
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+# route dependency enforcing per-ip and (optionally) per-username limits, e.g.
+#   dependencies=[Depends(rate_limit("token", RATE_LIMIT_TOKEN_PER_IP, RATE_LIMIT_TOKEN_PER_USERNAME, "user_name"))]
+# the username is read from the named query parameter; redis errors let the request through
+def rate_limit(route: str, per_ip: str, per_username: str = "", username_param: str | None = None):
+    ip_limit = parse_limit(per_ip)
+    username_limit = parse_limit(per_username)
+
+    async def dependency(request: Request):
+        if not RATE_LIMIT_ENABLED:
+            return
+        checks = []
+        if ip_limit:
+            checks.append(("ip", client_ip(request), ip_limit))
+        username = request.query_params.get(username_param) if username_param else None
+        if username_limit and username:
+            checks.append(("username", username.lower(), username_limit))
+
+        for scope, value, (limit, window) in checks:
+            try:
+                retry_after = await hit(f"{route}:{scope}:{value}", limit, window)
+            except Exception as e:
+                logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+                return
+            if retry_after:
+                RATE_LIMITED_REQUESTS.labels(route=route, scope=scope).inc()
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many requests. Try again later.",
+                    headers={"Retry-After": str(math.ceil(retry_after))},
+                )
+
+    return dependency
@@ -0,0 +1,140 @@
+import asyncio
+import time
+import logging
+import jwt
+from auth.keycloak_client import get_keycloak_client
+from config.settings import (
+    KEYCLOAK_REALM,
+    KEYCLOAK_AUDIENCE,
+    KEYCLOAK_JWT_LEEWAY,
+    KEYCLOAK_JWKS_MIN_REFRESH_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# claims copied into user_info, same keys Keycloak's /userinfo returns
+USER_INFO_CLAIMS = (
+    "sub",
+    "preferred_username",
+    "email",
+    "email_verified",
+    "name",
+    "given_name",
+    "family_name",
+)
+
+
+class TokenVerificationError(Exception):
+    """Token is a JWT but failed signature or claim validation."""
+
+
+class OpaqueTokenError(TokenVerificationError):
+    """Token is not a JWT, so it can only be checked through /userinfo."""
+
+
+class KeycloakMetadataError(Exception):
+    """Keycloak's discovery document or JWKS could not be parsed."""
+
+
+class KeycloakKeyCache:
+    """
+    In-process cache of the realm's OIDC discovery document and JWKS.
+    Keys are refetched when a token references an unknown `kid` (key rotation),
+    at most once every KEYCLOAK_JWKS_MIN_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self.issuer = None
+        self._jwks_uri = None
+        self._keys = {}
+        self._last_refresh = None
+        self._lock = asyncio.Lock()
+
+    async def get_signing_key(self, kid: str) -> jwt.PyJWK:
+        key = self._keys.get(kid)
+        if key is None:
+            await self._refresh(kid)
+            key = self._keys.get(kid)
+        if key is None:
+            raise TokenVerificationError(f"Unknown signing key '{kid}'")
+        return key
+
+    async def _refresh(self, kid: str):
+        async with self._lock:
+            # another request may have refreshed the keys while we waited
+            if kid in self._keys:
+                return
+            if self._last_refresh is not None and time.monotonic() - self._last_refresh < KEYCLOAK_JWKS_MIN_REFRESH_SECONDS:
+                return
+
+            client = get_keycloak_client()
+            if self._jwks_uri is None:
+                discovery_url = f"/realms/{KEYCLOAK_REALM}/.well-known/openid-configuration"
+                response = await client.get(discovery_url)
+                response.raise_for_status()
+                try:
+                    discovery = response.json()
+                    issuer, jwks_uri = discovery["issuer"], discovery["jwks_uri"]
+                except (ValueError, KeyError, TypeError) as e:
+                    raise KeycloakMetadataError(f"Malformed OIDC discovery document: {e!r}")
+                self.issuer = issuer
+                self._jwks_uri = jwks_uri
+
+            response = await client.get(self._jwks_uri)
+            response.raise_for_status()
+
+            try:
+                jwks = response.json()["keys"]
+                if not isinstance(jwks, list):
+                    raise TypeError("'keys' is not a list")
+            except (ValueError, KeyError, TypeError) as e:
+                raise KeycloakMetadataError(f"Malformed JWKS: {e!r}")
+
+            keys = {}
+            for jwk in jwks:
+                if not isinstance(jwk, dict) or jwk.get("use", "sig") != "sig" or not isinstance(jwk.get("kid"), str):
+                    continue
+                try:
+                    keys[jwk["kid"]] = jwt.PyJWK(jwk)
+                except (jwt.PyJWKError, ValueError, TypeError, KeyError) as e:
+                    logger.warning(f"Skipping unsupported JWK {jwk.get('kid')}: {e}")
+
+            self._keys = keys
+            self._last_refresh = time.monotonic()
+            logger.info(f"🔑 Loaded {len(keys)} signing keys from Keycloak JWKS")
+
+
+key_cache = KeycloakKeyCache()
+
+
+# verify the access token signature and claims locally, no call to Keycloak
+async def verify_access_token(token: str) -> dict:
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.DecodeError:
+        raise OpaqueTokenError("Token is not a JWT")
+
+    kid = header.get("kid")
+    if not kid or not isinstance(kid, str):
+        raise TokenVerificationError("Token header has no 'kid'")
+
+    key = await key_cache.get_signing_key(kid)
+
+    try:
+        claims = jwt.decode(
+            token,
+            key=key.key,
+            algorithms=[key.algorithm_name],
+            audience=KEYCLOAK_AUDIENCE,
+            issuer=key_cache.issuer,
+            leeway=KEYCLOAK_JWT_LEEWAY,
+            options={"require": ["exp", "iss"], "verify_aud": bool(KEYCLOAK_AUDIENCE)},
+        )
+    except jwt.PyJWTError as e:
+        raise TokenVerificationError(str(e))
+
+    # Keycloak marks access tokens with typ=Bearer; reject ID/refresh tokens
+    if claims.get("typ", "Bearer") != "Bearer":
+        raise TokenVerificationError(f"Unexpected token type '{claims.get('typ')}'")
+
+    return {claim: claims[claim] for claim in USER_INFO_CLAIMS if claim in claims}
@@ -0,0 +1,141 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI, Form, Request, Response
+from fastapi.responses import JSONResponse
+
+STUB_BASE_URL = "http://keycloak.stub"
+KID = "bench-key"
+
+
+@dataclass
+class StubConfig:
+    """Latency (ms) and error rate (0..1, answered with 503) injected per endpoint group."""
+
+    userinfo_latency_ms: float = 0
+    token_latency_ms: float = 0
+    admin_latency_ms: float = 0
+    userinfo_error_rate: float = 0
+    token_error_rate: float = 0
+    admin_error_rate: float = 0
+
+
+def _group(path: str) -> str:
+    if path.endswith("/userinfo"):
+        return "userinfo"
+    if path.endswith("/token"):
+        return "token"
+    if path.startswith("/admin/"):
+        return "admin"
+    return "other"
+
+
+# in-process Keycloak stand-in covering the endpoints this service calls
+def create_keycloak_stub(config: StubConfig) -> FastAPI:
+    app = FastAPI()
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    public_jwk.update({"kid": KID, "alg": "RS256", "use": "sig"})
+    users = {}    # username -> keycloak representation
+
+    def issue_tokens(realm: str, username: str) -> dict:
+        now = int(time.time())
+        claims = {
+            "iss": f"{STUB_BASE_URL}/realms/{realm}",
+            "sub": users.get(username, {}).get("id", str(uuid.uuid5(uuid.NAMESPACE_DNS, username))),
+            "typ": "Bearer",
+            "iat": now,
+            "exp": now + 300,
+            "preferred_username": username,
+            "email": users.get(username, {}).get("email", f"{username}@example.com"),
+            "email_verified": True,
+        }
+        access_token = jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": KID})
+        refresh_token = jwt.encode({**claims, "typ": "Refresh", "exp": now + 1800}, private_key, algorithm="RS256")
+        return {
+            "access_token": access_token,
+            "expires_in": 300,
+            "refresh_token": refresh_token,
+            "refresh_expires_in": 1800,
+            "token_type": "Bearer",
+        }
+
+    @app.middleware("http")
+    async def inject_faults(request: Request, call_next):
+        group = _group(request.url.path)
+        latency = getattr(config, f"{group}_latency_ms", 0)
+        if latency:
+            await asyncio.sleep(latency / 1000)
+        if random.random() < getattr(config, f"{group}_error_rate", 0):
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+        return await call_next(request)
+
+    @app.get("/realms/{realm}/.well-known/openid-configuration")
+    async def discovery(realm: str):
+        issuer = f"{STUB_BASE_URL}/realms/{realm}"
+        return {"issuer": issuer, "jwks_uri": f"{issuer}/protocol/openid-connect/certs"}
+
+    @app.get("/realms/{realm}/protocol/openid-connect/certs")
+    async def certs(realm: str):
+        return {"keys": [public_jwk]}
+
+    @app.post("/realms/{realm}/protocol/openid-connect/token")
+    async def token(realm: str, grant_type: str = Form(...), username: str = Form(None), refresh_token: str = Form(None)):
+        if grant_type == "refresh_token":
+            username = jwt.decode(refresh_token, options={"verify_signature": False})["preferred_username"]
+        return issue_tokens(realm, username or "admin")
+
+    @app.post("/realms/{realm}/protocol/openid-connect/logout")
+    async def logout(realm: str):
+        return Response(status_code=204)
+
+    @app.get("/realms/{realm}/protocol/openid-connect/userinfo")
+    async def userinfo(realm: str, request: Request):
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        claims = jwt.decode(token, options={"verify_signature": False})
+        return {key: claims[key] for key in ("sub", "preferred_username", "email", "email_verified")}
+
+    @app.get("/admin/realms/{realm}/users")
+    async def search_users(realm: str, username: str = None, first: int = 0, max: int = 100):
+        if username is not None:
+            return [user for name, user in users.items() if username.lower() in name]
+        return [users[name] for name in sorted(users)][first:first + max]
+
+    @app.post("/admin/realms/{realm}/users")
+    async def create_user(realm: str, request: Request):
+        user = await request.json()
+        username = user["username"].lower()
+        if username in users:
+            return JSONResponse({"errorMessage": "User exists with same username"}, status_code=409)
+        user_id = str(uuid.uuid4())
+        users[username] = {**user, "id": user_id, "username": username}
+        return Response(status_code=201, headers={"Location": f"{STUB_BASE_URL}/admin/realms/{realm}/users/{user_id}"})
+
+    @app.post("/admin/realms/{realm}/partialImport")
+    async def partial_import(realm: str, request: Request):
+        body = await request.json()
+        results = []
+        for user in body.get("users", []):
+            username = user["username"].lower()
+            if username in users:
+                results.append({"action": "SKIPPED", "resourceType": "USER", "resourceName": username, "id": users[username]["id"]})
+                continue
+            user_id = str(uuid.uuid4())
+            users[username] = {**user, "id": user_id, "username": username}
+            results.append({"action": "ADDED", "resourceType": "USER", "resourceName": username, "id": user_id})
+        added = sum(1 for result in results if result["action"] == "ADDED")
+        return {"added": added, "skipped": len(results) - added, "overwritten": 0, "results": results}
+
+    @app.put("/admin/realms/{realm}/users/{user_id}/reset-password")
+    @app.put("/admin/realms/{realm}/users/{user_id}/execute-actions-email")
+    async def user_action(realm: str, user_id: str):
+        if not any(user["id"] == user_id for user in users.values()):
+            return JSONResponse({"error": "User not found"}, status_code=404)
+        return Response(status_code=204)
+
+    return app
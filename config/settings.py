@@ -6,11 +6,115 @@ load_dotenv()
 # postgresql url
 DATABASE_URL = os.getenv("DATABASE_URL")
 
+# async engine pool (timeouts in seconds unless noted)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
 # keycloak credentials
 KEYCLOAK_URL = os.getenv("KEYCLOAK_URL")
 KEYCLOAK_REALM = os.getenv("KEYCLOAK_REALM")
 KEYCLOAK_CLIENT_ID = os.getenv("KEYCLOAK_CLIENT_ID")
 KEYCLOAK_CLIENT_SECRET = os.getenv("KEYCLOAK_CLIENT_SECRET")
+KEYCLOAK_ADMIN = os.getenv("KEYCLOAK_ADMIN")
+KEYCLOAK_ADMIN_PASSWORD = os.getenv("KEYCLOAK_ADMIN_PASSWORD")
+
+# admin token is reused until this many seconds before it expires
+KEYCLOAK_ADMIN_TOKEN_EXPIRY_MARGIN = int(os.getenv("KEYCLOAK_ADMIN_TOKEN_EXPIRY_MARGIN", "30"))
+
+# access token verification: "local" (JWT checked against the realm JWKS) or "userinfo"
+KEYCLOAK_TOKEN_VERIFICATION = os.getenv("KEYCLOAK_TOKEN_VERIFICATION", "local").lower()
+KEYCLOAK_USERINFO_FALLBACK = os.getenv("KEYCLOAK_USERINFO_FALLBACK", "true").lower() == "true"
+KEYCLOAK_AUDIENCE = os.getenv("KEYCLOAK_AUDIENCE")
+KEYCLOAK_JWT_LEEWAY = int(os.getenv("KEYCLOAK_JWT_LEEWAY", "10"))
+KEYCLOAK_JWKS_MIN_REFRESH_SECONDS = int(os.getenv("KEYCLOAK_JWKS_MIN_REFRESH_SECONDS", "30"))
+
+# shared keycloak http client (connection pool + timeouts, in seconds)
+KEYCLOAK_HTTP_MAX_CONNECTIONS = int(os.getenv("KEYCLOAK_HTTP_MAX_CONNECTIONS", "100"))
+KEYCLOAK_HTTP_MAX_KEEPALIVE = int(os.getenv("KEYCLOAK_HTTP_MAX_KEEPALIVE", "20"))
+KEYCLOAK_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("KEYCLOAK_HTTP_KEEPALIVE_EXPIRY", "30"))
+KEYCLOAK_HTTP_TIMEOUT = float(os.getenv("KEYCLOAK_HTTP_TIMEOUT", "10"))
+KEYCLOAK_HTTP_CONNECT_TIMEOUT = float(os.getenv("KEYCLOAK_HTTP_CONNECT_TIMEOUT", "3"))
+KEYCLOAK_HTTP_POOL_TIMEOUT = float(os.getenv("KEYCLOAK_HTTP_POOL_TIMEOUT", "5"))
+KEYCLOAK_HTTP2 = os.getenv("KEYCLOAK_HTTP2", "false").lower() == "true"
+
+# circuit breaker and retries around every Keycloak call
+KEYCLOAK_CB_FAILURE_THRESHOLD = int(os.getenv("KEYCLOAK_CB_FAILURE_THRESHOLD", "5"))
+KEYCLOAK_CB_RESET_SECONDS = float(os.getenv("KEYCLOAK_CB_RESET_SECONDS", "30"))
+KEYCLOAK_CB_HALF_OPEN_PROBES = int(os.getenv("KEYCLOAK_CB_HALF_OPEN_PROBES", "1"))
+KEYCLOAK_MAX_RETRIES = int(os.getenv("KEYCLOAK_MAX_RETRIES", "2"))
+KEYCLOAK_RETRY_BACKOFF_SECONDS = float(os.getenv("KEYCLOAK_RETRY_BACKOFF_SECONDS", "0.1"))
+# retry budget: each request earns RATIO of a retry, plus MIN_PER_SECOND retries for quiet periods
+KEYCLOAK_RETRY_BUDGET_RATIO = float(os.getenv("KEYCLOAK_RETRY_BUDGET_RATIO", "0.1"))
+KEYCLOAK_RETRY_BUDGET_MIN_PER_SECOND = float(os.getenv("KEYCLOAK_RETRY_BUDGET_MIN_PER_SECOND", "1"))
+# admission control: at most this many Keycloak calls in flight per worker; a call waiting longer
+# than the admission timeout for a slot is shed with 503 + Retry-After
+KEYCLOAK_MAX_IN_FLIGHT = int(os.getenv("KEYCLOAK_MAX_IN_FLIGHT", "50"))
+KEYCLOAK_ADMISSION_TIMEOUT = float(os.getenv("KEYCLOAK_ADMISSION_TIMEOUT", "0.5"))
+
+# per-client sliding-window rate limits as "<requests>/<seconds>" (empty disables a limit), kept in redis
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# use the first X-Forwarded-For address as the client ip (only behind a trusted proxy)
+RATE_LIMIT_TRUST_FORWARDED_FOR = os.getenv("RATE_LIMIT_TRUST_FORWARDED_FOR", "false").lower() == "true"
+RATE_LIMIT_TOKEN_PER_IP = os.getenv("RATE_LIMIT_TOKEN_PER_IP", "30/60")
+RATE_LIMIT_TOKEN_PER_USERNAME = os.getenv("RATE_LIMIT_TOKEN_PER_USERNAME", "10/60")
+RATE_LIMIT_REFRESH_PER_IP = os.getenv("RATE_LIMIT_REFRESH_PER_IP", "120/60")
+RATE_LIMIT_LOGOUT_PER_IP = os.getenv("RATE_LIMIT_LOGOUT_PER_IP", "60/60")
+RATE_LIMIT_VALIDATE_TOKEN_PER_IP = os.getenv("RATE_LIMIT_VALIDATE_TOKEN_PER_IP", "600/60")
+
+# keycloak sync worker
+SYNC_CONCURRENCY = int(os.getenv("SYNC_CONCURRENCY", "10"))
+SYNC_MAX_RETRIES = int(os.getenv("SYNC_MAX_RETRIES", "3"))
+SYNC_RETRY_BACKOFF_SECONDS = float(os.getenv("SYNC_RETRY_BACKOFF_SECONDS", "0.5"))
+SYNC_RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("SYNC_RETRY_MAX_BACKOFF_SECONDS", "10"))
+# between runs a failing row waits SYNC_ATTEMPT_BACKOFF_SECONDS * 2^(sync_attempts - 1), capped; rows that
+# reach SYNC_MAX_ATTEMPTS are dead-lettered (left unsynced and skipped until sync_attempts is reset)
+SYNC_ATTEMPT_BACKOFF_SECONDS = float(os.getenv("SYNC_ATTEMPT_BACKOFF_SECONDS", "30"))
+SYNC_ATTEMPT_MAX_BACKOFF_SECONDS = float(os.getenv("SYNC_ATTEMPT_MAX_BACKOFF_SECONDS", "3600"))
+SYNC_MAX_ATTEMPTS = int(os.getenv("SYNC_MAX_ATTEMPTS", "30"))
+# "individual" (exists check + create per user) or "batch" (Keycloak partialImport)
+SYNC_MODE = os.getenv("SYNC_MODE", "individual").lower()
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "100"))
+# unsynced rows read per keyset page; a run holds at most one page plus the in-flight work
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", "1000"))
+# inserts into users NOTIFY this channel and wake the sync; the interval poll is only a safety net
+SYNC_NOTIFY_ENABLED = os.getenv("SYNC_NOTIFY_ENABLED", "true").lower() == "true"
+SYNC_NOTIFY_CHANNEL = os.getenv("SYNC_NOTIFY_CHANNEL", "users_inserted")
+SYNC_NOTIFY_DEBOUNCE_SECONDS = float(os.getenv("SYNC_NOTIFY_DEBOUNCE_SECONDS", "1"))
+SYNC_POLL_INTERVAL_SECONDS = int(os.getenv("SYNC_POLL_INTERVAL_SECONDS", "300"))
+# only the worker holding the sync advisory lock runs the sync; the others retry this often
+SYNC_LEADER_RETRY_SECONDS = float(os.getenv("SYNC_LEADER_RETRY_SECONDS", "15"))
+
+# python -m tasks.reconcile_keycloak: realm users fetched per admin API page
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "500"))
+# rows repaired (and their caches invalidated) per transaction
+RECONCILE_BATCH_SIZE = int(os.getenv("RECONCILE_BATCH_SIZE", "1000"))
+RECONCILE_REPORT_SAMPLE_SIZE = int(os.getenv("RECONCILE_REPORT_SAMPLE_SIZE", "20"))
+
+# POST /users/bulk: rows validated and inserted per chunk
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+# write-behind registration: POST /users/token answers 202 once the signup is on a redis stream,
+# and a flusher in every worker batch-inserts the stream into postgres
+REGISTRATION_WRITE_BEHIND = os.getenv("REGISTRATION_WRITE_BEHIND", "false").lower() == "true"
+REGISTRATION_STREAM = os.getenv("REGISTRATION_STREAM", "user-service:registrations")
+REGISTRATION_GROUP = os.getenv("REGISTRATION_GROUP", "registration-flushers")
+REGISTRATION_FLUSH_BATCH_SIZE = int(os.getenv("REGISTRATION_FLUSH_BATCH_SIZE", "500"))
+REGISTRATION_FLUSH_RETRY_SECONDS = int(os.getenv("REGISTRATION_FLUSH_RETRY_SECONDS", "30"))
+# entries Postgres rejects, or that fail this many flushes, are moved to the dead-letter stream
+REGISTRATION_FLUSH_MAX_ATTEMPTS = int(os.getenv("REGISTRATION_FLUSH_MAX_ATTEMPTS", "10"))
+REGISTRATION_DEAD_LETTER_STREAM = os.getenv("REGISTRATION_DEAD_LETTER_STREAM", "user-service:registrations:dead-letter")
+
+# password-setup email queue (redis stream drained by a background worker)
+EMAIL_QUEUE_STREAM = os.getenv("EMAIL_QUEUE_STREAM", "user-service:password-emails")
+EMAIL_QUEUE_GROUP = os.getenv("EMAIL_QUEUE_GROUP", "email-workers")
+EMAIL_QUEUE_MAXLEN = int(os.getenv("EMAIL_QUEUE_MAXLEN", "100000"))
+EMAIL_WORKER_CONCURRENCY = int(os.getenv("EMAIL_WORKER_CONCURRENCY", "5"))
+EMAIL_DEDUPE_WINDOW_SECONDS = int(os.getenv("EMAIL_DEDUPE_WINDOW_SECONDS", "300"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+EMAIL_RETRY_DELAY_SECONDS = int(os.getenv("EMAIL_RETRY_DELAY_SECONDS", "30"))
 
 #SMTP email sender
 EMAIL_USER = os.getenv("EMAIL_USER")
@@ -19,7 +123,41 @@ EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
 # redis
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = int(os.getenv("REDIS_PORT"))
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "1"))
+REGISTRATION_CACHE_TTL_SECONDS = int(os.getenv("REGISTRATION_CACHE_TTL_SECONDS", "86400"))
+
+# GET /users/{username} and POST /users/lookup: read-through redis cache of user profiles
+PROFILE_CACHE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_TTL_SECONDS", "300"))
+PROFILE_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("PROFILE_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+USER_LOOKUP_MAX_USERNAMES = int(os.getenv("USER_LOOKUP_MAX_USERNAMES", "500"))
+
+# username -> keycloak user id (in-process LRU in front of redis)
+USER_ID_CACHE_SIZE = int(os.getenv("USER_ID_CACHE_SIZE", "10000"))
+USER_ID_CACHE_TTL_SECONDS = int(os.getenv("USER_ID_CACHE_TTL_SECONDS", "604800"))
 
+# redis bloom filter of known usernames/emails, lets registration skip duplicate checks for new names
+USER_FILTER_ENABLED = os.getenv("USER_FILTER_ENABLED", "true").lower() == "true"
+USER_FILTER_BITS = int(os.getenv("USER_FILTER_BITS", str(2 ** 24)))
+USER_FILTER_HASHES = int(os.getenv("USER_FILTER_HASHES", "6"))
+# a filter miss skips the Keycloak check only while the last reconcile run's realm usernames are this fresh
+USER_FILTER_KEYCLOAK_TTL_SECONDS = int(os.getenv("USER_FILTER_KEYCLOAK_TTL_SECONDS", "86400"))
 
+# logging: records are queued and written off the event loop by a background listener
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()    # "json" or "text"
+LOG_FILE = os.getenv("LOG_FILE", "logs/user_log.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# keep only a fraction of INFO/DEBUG records per logger prefix, e.g. "auth.keycloak_auth.authorized=0.1"
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "auth.keycloak_auth.authorized=0.1")
 
+# admin endpoints (/admin/profiler/*) require this value in X-Admin-Token; unset disables them
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
 
+# profiling: requests slower than this are captured with their outbound-call timeline (0 disables)
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_THRESHOLD_MS", "2000"))
+PROFILER_MAX_CAPTURES = int(os.getenv("PROFILER_MAX_CAPTURES", "50"))
+PROFILER_CAPTURE_TTL_SECONDS = int(os.getenv("PROFILER_CAPTURE_TTL_SECONDS", "86400"))
+PROFILER_INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.001"))
+# profile every request the worker's profiler is free for, keeping the profile only if the request is slow
+PROFILER_PROFILE_SLOW_REQUESTS = os.getenv("PROFILER_PROFILE_SLOW_REQUESTS", "false").lower() == "true"
@@ -1,17 +1,118 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import time
+from sqlalchemy import text, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from models.user_model import Base
-from config.settings import DATABASE_URL
+from config.settings import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_STATEMENT_TIMEOUT_MS,
+    SYNC_NOTIFY_CHANNEL,
+)
+from utils.metrics import DB_POOL_CHECKOUT_SECONDS, DB_QUERY_SECONDS
+from utils.timeline import record_span
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# same DATABASE_URL as before, driven through asyncpg
+ASYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="postgresql+asyncpg")
+# plain DSN for raw asyncpg connections (LISTEN)
+ASYNCPG_DSN = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long callers wait for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            ended = time.perf_counter()
+            DB_POOL_CHECKOUT_SECONDS.observe(ended - started)
+            record_span("postgres", "pool checkout", started, ended)
+
+
+engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=InstrumentedPool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=True,
+    connect_args={"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}},
+)
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    # kept on the execution context: a failed statement never reaches after_cursor_execute
+    context._query_started = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = context._query_started
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+    ended = time.perf_counter()
+    DB_QUERY_SECONDS.labels(statement=verb).observe(ended - started)
+    record_span("postgres", verb, started, ended)
+
+SessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+
+# create_all only creates missing tables; bring tables from older deployments up to date
+USERS_UPGRADE_DDL = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS created_at TIMESTAMPTZ NOT NULL DEFAULT now()",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS sync_attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_sync_error VARCHAR",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_sync_attempt_at TIMESTAMPTZ",
+    "CREATE INDEX IF NOT EXISTS ix_users_unsynced ON users (created_at, username) WHERE synced = false",
+    # registration relies on this to reject duplicate emails; existing duplicates must be cleaned up first
+    """
+    DO $$
+    BEGIN
+        IF to_regclass('ux_users_email') IS NOT NULL THEN
+            RETURN;
+        ELSIF EXISTS (SELECT 1 FROM users GROUP BY email HAVING count(*) > 1) THEN
+            RAISE WARNING 'users has duplicate emails, ux_users_email not created';
+        ELSE
+            CREATE UNIQUE INDEX ux_users_email ON users (email);
+        END IF;
+    END
+    $$
+    """,
+]
+
+# statement-level trigger: one NOTIFY per INSERT statement, however many rows it adds
+USERS_NOTIFY_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_users_inserted() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('{SYNC_NOTIFY_CHANNEL}', '');
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_notify_insert ON users",
+    """
+    CREATE TRIGGER users_notify_insert
+    AFTER INSERT ON users
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_users_inserted()
+    """,
+]
+
+# serializes schema setup when several workers boot at once
+INIT_DB_LOCK_ID = 4_242_000
+
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": INIT_DB_LOCK_ID})
+        await conn.run_sync(Base.metadata.create_all)
+        for statement in USERS_UPGRADE_DDL + USERS_NOTIFY_DDL:
+            await conn.execute(text(statement))
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()  
\ No newline at end of file
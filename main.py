@@ -1,28 +1,124 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from routers import user_routes
 from routers import auth_routes
-from db.postgres import init_db
-from apscheduler.schedulers.background import BackgroundScheduler
-from tasks.sync_to_keycloak import sync_unsynced_users
-import asyncio
-from logs.logging_config import setup_logger
+from routers import metrics_routes
+from routers import admin_routes
+from db.postgres import init_db, engine, SessionLocal
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from auth.keycloak_client import start_keycloak_client, close_keycloak_client
+from redis_cache.client import close_redis
+from redis_cache.user_filter import warm_user_filter
+from tasks.sync_to_keycloak import run_sync
+from tasks.sync_listener import SyncListener
+from tasks.sync_leader import SyncLeader
+from tasks.email_worker import EmailWorker
+from tasks.registration_flusher import RegistrationFlusher
+from config.settings import SYNC_NOTIFY_ENABLED, SYNC_POLL_INTERVAL_SECONDS, REGISTRATION_WRITE_BEHIND
+from logs.logging_config import setup_logger, request_id_var
+from utils.metrics import HTTP_REQUEST_SECONDS
+from utils.profiling import profile_request
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    await start_keycloak_client()
+
+    # Fill the registration filter in the background; until it is warm every check runs in full
+    filter_warmup = asyncio.create_task(warm_registration_filter())
+
+    # Password setup emails are sent from a queue, off the request and sync paths
+    email_worker = EmailWorker()
+    email_worker.start()
+
+    # Buffered (write-behind) registrations are flushed to Postgres in batches by every worker
+    registration_flusher = RegistrationFlusher()
+    if REGISTRATION_WRITE_BEHIND:
+        registration_flusher.start()
+
+    # New users are synced as soon as Postgres NOTIFYs the insert
+    listener = SyncListener(run_sync)
+
+    # Background scheduler as a slow safety net, runs on the app's event loop so it shares the Keycloak client
+    scheduler = AsyncIOScheduler()
+    scheduler.add_job(run_sync, trigger='interval', seconds=SYNC_POLL_INTERVAL_SECONDS, max_instances=1, coalesce=True)
+    scheduler.start(paused=True)
 
+    # Only one worker (the advisory lock holder) listens and polls, so runs are never duplicated
+    async def start_sync():
+        if SYNC_NOTIFY_ENABLED:
+            listener.start()
+        scheduler.resume()
 
-app = FastAPI(title="User Info Microservice")
+    async def stop_sync():
+        scheduler.pause()
+        await listener.stop()
+
+    leader = SyncLeader(start_sync, stop_sync)
+    leader.start()
+
+    yield
+
+    await leader.stop()
+    scheduler.shutdown(wait=False)
+    await registration_flusher.stop()
+    await email_worker.stop()
+    filter_warmup.cancel()
+    await close_keycloak_client()
+    await close_redis()
+    await engine.dispose()
+
+
+async def warm_registration_filter():
+    try:
+        async with SessionLocal() as db:
+            await warm_user_filter(db)
+    except Exception as e:
+        logger.error(f"❌ Could not warm the user filter: {e}")
+
+
+app = FastAPI(title="User Info Microservice", lifespan=lifespan)
 
-init_db()
 setup_logger()
 
 app.include_router(user_routes.router, prefix="/users", tags=["Users"])
 app.include_router(auth_routes.router, prefix="/auth")
+app.include_router(metrics_routes.router)
+app.include_router(admin_routes.router, prefix="/admin")
+
 
+# request latency per route template (not raw path, to keep label cardinality bounded)
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.labels(
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=response.status_code,
+    ).observe(time.perf_counter() - started)
+    return response
 
 
-def run_sync_task():
-    asyncio.run(sync_unsynced_users())
+# sampled profiles (when enabled via /admin/profiler/enable) and slow-request captures
+app.middleware("http")(profile_request)
 
-# Background scheduler
-scheduler = BackgroundScheduler()
-scheduler.add_job(run_sync_task, trigger='interval', seconds=15, max_instances=1, coalesce=True)
-scheduler.start()
 
+# tag every log line of a request with its id (taken from X-Request-ID when the caller sends one)
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
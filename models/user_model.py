@@ -1,8 +1,9 @@
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, Integer, DateTime, Index, func
 from sqlalchemy.ext.declarative import declarative_base
-from pydantic import BaseModel, EmailStr, field_validator
+from pydantic import BaseModel, EmailStr, Field, field_validator
 from utils.username_pattern import validate_username
 from utils.email_pattern import validate_email_pattern
+from config.settings import USER_LOOKUP_MAX_USERNAMES
 
 
 Base = declarative_base()
@@ -15,6 +16,16 @@ class User(Base):
     lastname = Column(String, nullable=False)
     password = Column(String, nullable=True) 
     synced = Column(Boolean, default=False)
+    sync_attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    last_sync_error = Column(String, nullable=True)
+    last_sync_attempt_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    # covers only the sync backlog, in the order the sync pages through it
+    __table_args__ = (
+        Index("ix_users_unsynced", created_at, username, postgresql_where=(synced == False)),
+        Index("ux_users_email", email, unique=True),
+    )
 
 
 # Pydantic Models
@@ -45,6 +56,23 @@ class UserCreate(BaseModel):
 class TokenInput(BaseModel):
     token: str
 
+class UserProfile(BaseModel):
+    username: str
+    email: str
+    firstName: str
+    lastName: str
+    synced: bool
+
+class UserLookupRequest(BaseModel):
+    usernames: list[str] = Field(..., min_length=1, max_length=USER_LOOKUP_MAX_USERNAMES)
+
+class UserLookupResponse(BaseModel):
+    users: list[UserProfile]
+    missing: list[str]
+
+class RefreshTokenRequest(BaseModel):
+    refresh_token: str
+
 class EmailRequest(BaseModel):
     username: str
     email: EmailStr
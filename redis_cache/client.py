@@ -0,0 +1,62 @@
+import time
+import redis.asyncio as redis
+from redis.asyncio.client import Pipeline
+from config.settings import REDIS_HOST, REDIS_PORT, REDIS_MAX_CONNECTIONS, REDIS_SOCKET_TIMEOUT
+from utils.metrics import REDIS_COMMAND_SECONDS
+from utils.timeline import record_span
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        started = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            ended = time.perf_counter()
+            REDIS_COMMAND_SECONDS.labels(command="PIPELINE").observe(ended - started)
+            record_span("redis", "PIPELINE", started, ended)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records round-trip time per command."""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            ended = time.perf_counter()
+            command = str(args[0]).upper()
+            REDIS_COMMAND_SECONDS.labels(command=command).observe(ended - started)
+            record_span("redis", command, started, ended)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> Pipeline:
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+# shared async redis client, connections are opened lazily from the pool
+redis_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=0,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    socket_timeout=REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+)
+redis_client = InstrumentedRedis(connection_pool=redis_pool)
+
+# separate small pool without a read timeout for blocking reads (XREADGROUP ... BLOCK)
+blocking_redis_pool = redis.ConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=0,
+    max_connections=4,
+    socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+)
+blocking_redis_client = InstrumentedRedis(connection_pool=blocking_redis_pool)
+
+
+async def close_redis():
+    for client, pool in ((redis_client, redis_pool), (blocking_redis_client, blocking_redis_pool)):
+        await client.aclose()
+        await pool.disconnect()
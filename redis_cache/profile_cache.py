@@ -0,0 +1,59 @@
+import logging
+import msgpack
+from redis_cache.client import redis_client
+from config.settings import PROFILE_CACHE_TTL_SECONDS, PROFILE_CACHE_NEGATIVE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "user-service:profile:"
+
+# stored as a msgpack array in this field order; unknown usernames are cached as msgpack nil
+FIELDS = ("username", "email", "firstName", "lastName", "synced")
+MISSING = msgpack.packb(None)
+
+
+def _key(username: str) -> str:
+    return f"{KEY_PREFIX}{username}"
+
+
+# cached profiles for the given usernames: a dict for known users, None for cached misses;
+# usernames not in the cache (or all of them, if redis is down) are left out
+async def get_cached_profiles(usernames: list[str]) -> dict:
+    try:
+        raws = await redis_client.mget([_key(username) for username in usernames])
+    except Exception as e:
+        logger.warning(f"Profile cache unavailable: {e}")
+        return {}
+
+    cached = {}
+    for username, raw in zip(usernames, raws):
+        if raw is None:
+            continue
+        values = msgpack.unpackb(raw)
+        cached[username] = dict(zip(FIELDS, values)) if values is not None else None
+    return cached
+
+
+# cache loaded profiles; usernames mapped to None are cached as misses with a shorter TTL
+async def cache_profiles(profiles: dict):
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for username, profile in profiles.items():
+                if profile is None:
+                    pipe.set(_key(username), MISSING, ex=PROFILE_CACHE_NEGATIVE_TTL_SECONDS)
+                else:
+                    pipe.set(_key(username), msgpack.packb([profile[field] for field in FIELDS]), ex=PROFILE_CACHE_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not cache {len(profiles)} profile(s): {e}")
+
+
+# drop cached entries (including cached misses) after users are inserted or synced
+async def invalidate_profiles(usernames):
+    keys = [_key(username) for username in usernames]
+    if not keys:
+        return
+    try:
+        await redis_client.delete(*keys)
+    except Exception as e:
+        logger.warning(f"Could not invalidate {len(keys)} cached profile(s): {e}")
@@ -0,0 +1,42 @@
+import time
+import uuid
+from redis_cache.client import redis_client
+
+KEY_PREFIX = "user-service:rate-limit:"
+
+# sliding window over a sorted set of request timestamps (ms); returns 0 when the request
+# is admitted, otherwise the ms until the oldest request in the window expires
+SLIDING_WINDOW_SCRIPT = """
+local key = KEYS[1]
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+if redis.call('ZCARD', key) < limit then
+    redis.call('ZADD', key, now, ARGV[4])
+    redis.call('PEXPIRE', key, window)
+    return 0
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+return math.max(1, tonumber(oldest[2]) + window - now)
+"""
+
+_sliding_window = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+
+
+# "30/60" -> (30, 60.0); empty disables the limit
+def parse_limit(value: str) -> tuple[int, float] | None:
+    if not value:
+        return None
+    requests, seconds = value.split("/", 1)
+    return int(requests), float(seconds)
+
+
+# count one request against `key`; returns 0 if allowed, else seconds until a slot frees up
+async def hit(key: str, limit: int, window_seconds: float) -> float:
+    now_ms = int(time.time() * 1000)
+    retry_after_ms = await _sliding_window(
+        keys=[f"{KEY_PREFIX}{key}"],
+        args=[now_ms, int(window_seconds * 1000), limit, f"{now_ms}-{uuid.uuid4().hex[:8]}"],
+    )
+    return int(retry_after_ms) / 1000
@@ -1,39 +1,81 @@
 # Redis concept optional here
 
+from fastapi import HTTPException
 from models.user_model import UserCreate
-from models.user_model import UserCreate
-from config.settings import REDIS_HOST, REDIS_PORT
+from redis_cache.client import redis_client
+from config.settings import REGISTRATION_CACHE_TTL_SECONDS
 from pydantic import ValidationError
 import logging
-import redis
-import json
+import msgpack
 
 
 logger = logging.getLogger(__name__)
 
 
-# REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-# REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0)
+# every registration key lives under this prefix, so bulk reads never touch unrelated keys
+KEY_PREFIX = "user-service:registration:"
+EMAIL_KEY_PREFIX = "user-service:registration-email:"
+SCAN_BATCH_SIZE = 500
+
+# stored as a msgpack array in this field order instead of a JSON object
+FIELDS = ("username", "email", "firstName", "lastName")
+
+
+def _key(username: str) -> str:
+    return f"{KEY_PREFIX}{username}"
+
+def _email_key(email: str) -> str:
+    return f"{EMAIL_KEY_PREFIX}{email.lower()}"
+
+def _dump(user: UserCreate) -> bytes:
+    data = user.model_dump()
+    return msgpack.packb([data[field] for field in FIELDS])
 
-def cache_user_data(user: UserCreate):
-    redis_client.set(user.username, json.dumps(user.dict()))
-    logger.info(f"🕒 Cached raw data for user {user.username} for background sync.")
+def _load(raw: bytes) -> UserCreate:
+    return UserCreate(**dict(zip(FIELDS, msgpack.unpackb(raw))))
 
-def pop_cached_user(username: str) -> UserCreate:
-    raw_data = redis_client.get(username)
+
+# hold the username and email of a registration that is not in Postgres yet;
+# False when either one is already held by another pending registration
+async def reserve_registration(user: UserCreate) -> bool:
+    if not await redis_client.set(_key(user.username), _dump(user), nx=True, ex=REGISTRATION_CACHE_TTL_SECONDS):
+        return False
+    if not await redis_client.set(_email_key(user.email), user.username, nx=True, ex=REGISTRATION_CACHE_TTL_SECONDS):
+        await redis_client.delete(_key(user.username))
+        return False
+    logger.info("🕒 Reserved %s for a buffered registration", user.username)
+    return True
+
+async def release_registrations(users: list[UserCreate]):
+    keys = [_key(user.username) for user in users] + [_email_key(user.email) for user in users]
+    if keys:
+        await redis_client.delete(*keys)
+
+async def pop_cached_user(username: str) -> UserCreate | None:
+    raw_data = await redis_client.getdel(_key(username))
     if raw_data:
-        redis_client.delete(username)
-        return UserCreate(**json.loads(raw_data))
+        return _load(raw_data)
     return None
 
-def get_all_cached_users() -> dict:
+async def get_all_cached_users() -> dict:
     cached_users = {}
-    for key in redis_client.keys("*"):
-        raw = redis_client.get(key)
+    keys = []
+    async for key in redis_client.scan_iter(match=f"{KEY_PREFIX}*", count=SCAN_BATCH_SIZE):
+        keys.append(key)
+        if len(keys) >= SCAN_BATCH_SIZE:
+            await _load_into(cached_users, keys)
+            keys = []
+    if keys:
+        await _load_into(cached_users, keys)
+    return cached_users
+
+async def _load_into(cached_users: dict, keys: list):
+    for key, raw in zip(keys, await redis_client.mget(keys)):
+        if raw is None:
+            continue  # expired or popped between SCAN and MGET
+        username = key.decode().removeprefix(KEY_PREFIX)
         try:
-            cached_users[key.decode()] = UserCreate(**json.loads(raw))
-        except ValidationError as e:
+            cached_users[username] = _load(raw)
+        except (ValidationError, HTTPException, ValueError, TypeError) as e:
             logger.error(f"Invalid user data in Redis for key {key}: {e}")
             continue  # Skip this invalid record
-    return cached_users
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.user_model import User
+from redis_cache.client import redis_client
+from config.settings import USER_FILTER_ENABLED, USER_FILTER_BITS, USER_FILTER_HASHES, USER_FILTER_KEYCLOAK_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Bloom filter stored as a plain redis bitmap (SETBIT/GETBIT), no redis modules needed.
+# A miss means the username/email is definitely unknown; a hit only means "maybe".
+FILTER_KEY = "user-service:user-filter"
+WARM_KEY = "user-service:user-filter:warm"
+# realm users need not exist in Postgres; until the reconcile job has loaded their usernames
+# (and again once that load is older than USER_FILTER_KEYCLOAK_TTL_SECONDS) username misses are not trusted
+KEYCLOAK_WARM_KEY = "user-service:user-filter:keycloak-warm"
+WARM_CHUNK_SIZE = 5000
+
+
+def _offsets(kind: str, value: str) -> list[int]:
+    digest = hashlib.blake2b(f"{kind}:{value.lower()}".encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "big")
+    h2 = int.from_bytes(digest[8:], "big") | 1
+    return [(h1 + i * h2) % USER_FILTER_BITS for i in range(USER_FILTER_HASHES)]
+
+
+def _add(pipe, username: str, email: str):
+    for offset in _offsets("username", username):
+        pipe.setbit(FILTER_KEY, offset, 1)
+    for offset in _offsets("email", email):
+        pipe.setbit(FILTER_KEY, offset, 1)
+
+
+# record a stored user in the filter
+async def add_user_to_filter(username: str, email: str):
+    await add_users_to_filter([(username, email)])
+
+
+# record many stored (username, email) pairs in one pipeline
+async def add_users_to_filter(users: list[tuple[str, str]]):
+    if not USER_FILTER_ENABLED or not users:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for username, email in users:
+                _add(pipe, username, email)
+            await pipe.execute()
+    except Exception as e:
+        # a missing entry would let a duplicate skip the checks, so drop the warm marker
+        logger.error(f"❌ Could not add {len(users)} user(s) to user filter, marking it cold: {e}")
+        await _mark_cold()
+
+
+# record usernames Keycloak knows about, whether or not Postgres has them
+async def add_usernames_to_filter(usernames: list[str]):
+    if not USER_FILTER_ENABLED or not usernames:
+        return
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for username in usernames:
+                for offset in _offsets("username", username):
+                    pipe.setbit(FILTER_KEY, offset, 1)
+            await pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ Could not add {len(usernames)} username(s) to user filter, marking it cold: {e}")
+        await _mark_cold()
+
+
+# called by the reconcile job after every realm username went through add_usernames_to_filter
+async def mark_keycloak_usernames_loaded():
+    if USER_FILTER_ENABLED:
+        await redis_client.set(KEYCLOAK_WARM_KEY, 1, ex=USER_FILTER_KEYCLOAK_TTL_SECONDS)
+
+
+# returns (username_maybe_exists, email_maybe_exists); any doubt answers True
+async def might_exist(username: str, email: str) -> tuple[bool, bool]:
+    if not USER_FILTER_ENABLED:
+        return True, True
+    username_offsets = _offsets("username", username)
+    email_offsets = _offsets("email", email)
+    try:
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.exists(WARM_KEY)
+            pipe.exists(KEYCLOAK_WARM_KEY)
+            for offset in username_offsets + email_offsets:
+                pipe.getbit(FILTER_KEY, offset)
+            results = await pipe.execute()
+    except Exception as e:
+        logger.error(f"❌ User filter unavailable, falling back to full duplicate checks: {e}")
+        return True, True
+
+    warm, keycloak_warm, *bits = results
+    if not warm:
+        return True, True
+    username_maybe_exists = not keycloak_warm or all(bits[:len(username_offsets)])
+    return username_maybe_exists, all(bits[len(username_offsets):])
+
+
+# load every username/email from Postgres into the filter (skipped if already warm)
+async def warm_user_filter(db: AsyncSession):
+    if not USER_FILTER_ENABLED or await redis_client.exists(WARM_KEY):
+        return
+
+    count = 0
+    result = await db.stream(select(User.username, User.email).execution_options(yield_per=WARM_CHUNK_SIZE))
+    async for rows in result.partitions():
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for username, email in rows:
+                _add(pipe, username, email)
+            await pipe.execute()
+        count += len(rows)
+
+    await redis_client.set(WARM_KEY, 1)
+    logger.info(f"🌡️ User filter warmed with {count} users")
+
+
+async def _mark_cold():
+    try:
+        await redis_client.delete(WARM_KEY, KEYCLOAK_WARM_KEY)
+    except Exception:
+        pass
@@ -0,0 +1,74 @@
+import logging
+from collections import OrderedDict
+from redis_cache.client import redis_client
+from config.settings import USER_ID_CACHE_SIZE, USER_ID_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "user-service:keycloak-id:"
+
+
+class UserIdCache:
+    """
+    Keycloak user ids never change for a username, so lookups are cached in a small
+    in-process LRU backed by Redis (shared across workers). Entries are dropped when a
+    downstream admin call returns 404 for the cached id.
+    """
+
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._local = OrderedDict()
+
+    async def get(self, username: str) -> str | None:
+        username = username.lower()
+        user_id = self._local.get(username)
+        if user_id is not None:
+            self._local.move_to_end(username)
+            return user_id
+
+        try:
+            raw = await redis_client.get(f"{KEY_PREFIX}{username}")
+        except Exception as e:
+            logger.warning(f"User id cache unavailable for {username}: {e}")
+            return None
+        if raw is None:
+            return None
+        user_id = raw.decode()
+        self._remember(username, user_id)
+        return user_id
+
+    async def set(self, username: str, user_id: str):
+        username = username.lower()
+        self._remember(username, user_id)
+        try:
+            await redis_client.set(f"{KEY_PREFIX}{username}", user_id, ex=USER_ID_CACHE_TTL_SECONDS)
+        except Exception as e:
+            logger.warning(f"Could not cache user id for {username}: {e}")
+
+    async def invalidate(self, username: str):
+        username = username.lower()
+        self._local.pop(username, None)
+        try:
+            await redis_client.delete(f"{KEY_PREFIX}{username}")
+        except Exception as e:
+            logger.warning(f"Could not invalidate cached user id for {username}: {e}")
+
+    async def invalidate_many(self, usernames: list[str]):
+        usernames = [username.lower() for username in usernames]
+        if not usernames:
+            return
+        for username in usernames:
+            self._local.pop(username, None)
+        try:
+            await redis_client.delete(*(f"{KEY_PREFIX}{username}" for username in usernames))
+        except Exception as e:
+            logger.warning(f"Could not invalidate {len(usernames)} cached user ids: {e}")
+
+    def _remember(self, username: str, user_id: str):
+        self._local[username] = user_id
+        self._local.move_to_end(username)
+        if len(self._local) > self._maxsize:
+            self._local.popitem(last=False)
+
+
+user_id_cache = UserIdCache(USER_ID_CACHE_SIZE)
@@ -0,0 +1,66 @@
+import secrets
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import HTMLResponse
+from utils.profiling import (
+    Profiler,
+    enable_profiling,
+    disable_profiling,
+    list_captures,
+    get_capture,
+    get_capture_profile,
+)
+from config.settings import ADMIN_API_TOKEN
+
+
+# admin endpoints only exist when ADMIN_API_TOKEN is configured
+async def require_admin(x_admin_token: str = Header(None)):
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+router = APIRouter(tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@router.post("/profiler/enable")
+async def enable_profiler(
+    sample_rate: float = Query(0.01, gt=0, le=1),
+    duration_seconds: int = Query(600, gt=0, le=86400),
+):
+    """
+    Profiles `sample_rate` of requests on every worker for `duration_seconds`, then switches itself off.
+    """
+    if Profiler is None:
+        raise HTTPException(status_code=501, detail="pyinstrument is not installed; only slow-request timelines are captured")
+    await enable_profiling(sample_rate, duration_seconds)
+    return {"sample_rate": sample_rate, "duration_seconds": duration_seconds}
+
+
+@router.post("/profiler/disable", status_code=204)
+async def disable_profiler():
+    await disable_profiling()
+
+
+@router.get("/profiler/captures")
+async def captures():
+    """
+    The most recent sampled and slow-request captures, newest first.
+    """
+    return await list_captures()
+
+
+@router.get("/profiler/captures/{capture_id}")
+async def capture(capture_id: str):
+    result = await get_capture(capture_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Capture not found or expired")
+    return result
+
+
+@router.get("/profiler/captures/{capture_id}/profile", response_class=HTMLResponse)
+async def capture_profile(capture_id: str):
+    profile = await get_capture_profile(capture_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="No profile for this capture")
+    return HTMLResponse(profile, headers={"Content-Disposition": f'attachment; filename="profile-{capture_id}.html"'})
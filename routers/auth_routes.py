@@ -1,11 +1,20 @@
 from fastapi import APIRouter, HTTPException, Depends
 from auth.keycloak_auth import get_current_user
-from services.auth_service import get_access_token
+from auth.rate_limit import rate_limit
+from config.settings import (
+    RATE_LIMIT_TOKEN_PER_IP,
+    RATE_LIMIT_TOKEN_PER_USERNAME,
+    RATE_LIMIT_REFRESH_PER_IP,
+    RATE_LIMIT_LOGOUT_PER_IP,
+    RATE_LIMIT_VALIDATE_TOKEN_PER_IP,
+)
+from models.user_model import RefreshTokenRequest
+from services.auth_service import get_access_token, refresh_access_token, logout_session
 
 router = APIRouter(tags=["Authentication"])
 
 
-@router.post("/token")
+@router.post("/token", dependencies=[Depends(rate_limit("token", RATE_LIMIT_TOKEN_PER_IP, RATE_LIMIT_TOKEN_PER_USERNAME, "user_name"))])
 async def get_token(user_name: str, password: str):
     try:
         return await get_access_token(user_name, password)
@@ -13,7 +22,23 @@ async def get_token(user_name: str, password: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.get("/validate-token")
+@router.post("/refresh", dependencies=[Depends(rate_limit("refresh", RATE_LIMIT_REFRESH_PER_IP))])
+async def refresh_token(data: RefreshTokenRequest):
+    """
+    Exchanges a refresh token for a new access/refresh token pair, without the password grant.
+    """
+    return await refresh_access_token(data.refresh_token)
+
+
+@router.post("/logout", status_code=204, dependencies=[Depends(rate_limit("logout", RATE_LIMIT_LOGOUT_PER_IP))])
+async def logout(data: RefreshTokenRequest):
+    """
+    Ends the Keycloak session of the refresh token, revoking it.
+    """
+    await logout_session(data.refresh_token)
+
+
+@router.get("/validate-token", dependencies=[Depends(rate_limit("validate-token", RATE_LIMIT_VALIDATE_TOKEN_PER_IP))])
 async def validate_token(user_info: dict = Depends(get_current_user)):
     """
     Protected endpoint - Requires Bearer token. Will show 🔒 in Swagger.
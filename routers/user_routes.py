@@ -1,9 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from models.user_model import UserCreate, PasswordResetRequest
-from services.user_service import register_user_data, handle_password_reset
-from services.reset_email_service import reset_password_email
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, status
+from fastapi.responses import StreamingResponse
+from models.user_model import UserCreate, PasswordResetRequest, UserProfile, UserLookupRequest, UserLookupResponse
+from services.user_service import register_user_data, buffer_user_registration, handle_password_reset
+from config.settings import REGISTRATION_WRITE_BEHIND
+from services.email_queue import enqueue_password_email
+from services.bulk_registration_service import bulk_register_users
+from services.profile_service import get_user_profiles
+from auth.keycloak_auth import get_current_user
+from auth.keycloak_client import keycloak_unavailable
+from sqlalchemy.ext.asyncio import AsyncSession
 from db.postgres import get_db
+import httpx
 import logging
 
 router = APIRouter()
@@ -11,10 +18,28 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+class UploadStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse for endpoints that read the request body while streaming the response.
+    The stock class listens on `receive` for a disconnect, which would swallow body chunks the
+    handler has not read yet; here the body reader alone consumes `receive` and sees the disconnect.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
 @router.post("/token")
-async def register_user(user: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user: UserCreate, response: Response, db: AsyncSession = Depends(get_db)):
     try:
+        if REGISTRATION_WRITE_BEHIND:
+            response.status_code = status.HTTP_202_ACCEPTED
+            return await buffer_user_registration(user, db)
         return await register_user_data(user, db)
+    except HTTPException:
+        raise
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -22,23 +47,57 @@ async def register_user(user: UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
     
 
-@router.post("/send-password-email")
+@router.post("/bulk")
+async def bulk_register(request: Request):
+    """
+    Registers users from a streamed NDJSON body (one UserCreate object per line) or,
+    with Content-Type text/csv, a CSV body with a username,email,firstName,lastName header.
+    Streams back one NDJSON result per row followed by a summary line.
+    """
+    fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    return UploadStreamingResponse(bulk_register_users(request.stream(), fmt), media_type="application/x-ndjson")
+
+
+@router.post("/send-password-email", status_code=202)
 async def send_password_email(username: str):
     try:
-        await reset_password_email(username)
-        return {"message": f"Email sent to {username}"}
+        if await enqueue_password_email(username):
+            return {"message": f"Email queued for {username}"}
+        return {"message": f"Email for {username} was already queued recently"}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to send email: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to queue email: {str(e)}")
     
 
 @router.post("/reset-password")
-async def reset_password(data: PasswordResetRequest, db: Session = Depends(get_db)):
+async def reset_password(data: PasswordResetRequest, db: AsyncSession = Depends(get_db)):
     try:
         result = await handle_password_reset(data.username, data.new_password, db)
         return result
     except HTTPException as e:
         raise e
+    except httpx.RequestError as e:
+        logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
+        raise keycloak_unavailable(e)
     except Exception as e:
         logger.error(f"Password reset error: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal error during password reset")
 
+
+@router.post("/lookup", response_model=UserLookupResponse, dependencies=[Depends(get_current_user)])
+async def lookup_users(data: UserLookupRequest, db: AsyncSession = Depends(get_db)):
+    """
+    Batch profile lookup; unknown usernames are listed under `missing`.
+    """
+    profiles = await get_user_profiles(db, data.usernames)
+    return {
+        "users": [profile for profile in profiles.values() if profile is not None],
+        "missing": [username for username, profile in profiles.items() if profile is None],
+    }
+
+
+@router.get("/{username}", response_model=UserProfile, dependencies=[Depends(get_current_user)])
+async def get_user(username: str, db: AsyncSession = Depends(get_db)):
+    profile = (await get_user_profiles(db, [username]))[username]
+    if profile is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return profile
@@ -1,13 +1,14 @@
 import httpx
 from fastapi import HTTPException
-from config.settings import KEYCLOAK_URL, KEYCLOAK_REALM, KEYCLOAK_CLIENT_ID, KEYCLOAK_CLIENT_SECRET
+from auth.keycloak_client import get_keycloak_client, keycloak_unavailable, raise_for_keycloak_outage
+from config.settings import KEYCLOAK_REALM, KEYCLOAK_CLIENT_ID, KEYCLOAK_CLIENT_SECRET
 import logging
 
 logger = logging.getLogger(__name__)
 
 # get token to validate
 async def get_access_token(username: str,password: str):
-    token_url = f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/protocol/openid-connect/token"
+    token_url = f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/token"
     data = {
         "grant_type": "password",
         "client_id": KEYCLOAK_CLIENT_ID,
@@ -16,15 +17,15 @@ async def get_access_token(username: str,password: str):
         "password": password,
         "scope": "openid"
     }
-    async with httpx.AsyncClient() as client:
-        response = await client.post(token_url, data=data)
+    try:
+        response = await get_keycloak_client().post(token_url, data=data)
+        raise_for_keycloak_outage(response)
+    except httpx.RequestError as e:
+        logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
+        raise keycloak_unavailable(e)
 
     if response.status_code != 200:
-        try:
-            detail_json = response.json()
-            error_description = detail_json.get("error_description", "")
-        except Exception:
-            error_description = response.text
+        error_description = keycloak_error_description(response)
 
         # Log based on Keycloak's specific error
         if "account is not fully set up" in error_description.lower():
@@ -34,10 +35,58 @@ async def get_access_token(username: str,password: str):
 
         raise HTTPException(status_code=401, detail=error_description)
 
-    logger.info(f"Token is generated successfully for the user {username}")
+    logger.info("Token is generated successfully for the user %s", username)
     return response.json()
 
 
+# renew an access token with the refresh_token grant (no password check on Keycloak's side)
+async def refresh_access_token(refresh_token: str):
+    token_url = f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/token"
+    data = {
+        "grant_type": "refresh_token",
+        "client_id": KEYCLOAK_CLIENT_ID,
+        "client_secret": KEYCLOAK_CLIENT_SECRET,
+        "refresh_token": refresh_token,
+    }
+    try:
+        response = await get_keycloak_client().post(token_url, data=data)
+        raise_for_keycloak_outage(response)
+    except httpx.RequestError as e:
+        logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
+        raise keycloak_unavailable(e)
+
+    if response.status_code != 200:
+        error_description = keycloak_error_description(response)
+        logger.warning("🚫 Token refresh rejected: %s", error_description)
+        raise HTTPException(status_code=401, detail=error_description)
+
+    return response.json()
+
+
+# end the Keycloak session behind a refresh token, revoking its access and refresh tokens
+async def logout_session(refresh_token: str):
+    logout_url = f"/realms/{KEYCLOAK_REALM}/protocol/openid-connect/logout"
+    data = {
+        "client_id": KEYCLOAK_CLIENT_ID,
+        "client_secret": KEYCLOAK_CLIENT_SECRET,
+        "refresh_token": refresh_token,
+    }
+    try:
+        response = await get_keycloak_client().post(logout_url, data=data)
+        raise_for_keycloak_outage(response)
+    except httpx.RequestError as e:
+        logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
+        raise keycloak_unavailable(e)
+
+    if response.status_code not in (200, 204):
+        error_description = keycloak_error_description(response)
+        logger.warning("🚫 Logout rejected: %s", error_description)
+        raise HTTPException(status_code=401, detail=error_description)
 
 
+def keycloak_error_description(response: httpx.Response) -> str:
+    try:
+        return response.json().get("error_description", "")
+    except Exception:
+        return response.text
 
@@ -0,0 +1,117 @@
+import codecs
+import csv
+import json
+import logging
+from fastapi import HTTPException
+from pydantic import ValidationError
+from db.postgres import SessionLocal
+from models.user_model import UserCreate
+from services.postgres_service import insert_users_ignore_existing
+from redis_cache.user_filter import add_users_to_filter
+from redis_cache.profile_cache import invalidate_profiles
+from config.settings import BULK_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+# split a streamed request body into decoded text lines
+async def iter_lines(body):
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in body:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+# yield (line_number, row dict or None, parse error) from an NDJSON or CSV body
+async def iter_rows(body, fmt: str):
+    header = None
+    line_number = 0
+    async for line in iter_lines(body):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            if fmt == "csv":
+                values = next(csv.reader([line]))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                yield line_number, dict(zip(header, values)), None
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("expected a JSON object")
+                yield line_number, row, None
+        except ValueError as e:
+            yield line_number, None, f"Unparseable row: {e}"
+
+
+# register users from a streamed body, yielding one NDJSON result line per row and a final summary;
+# inserted rows are left unsynced for the Keycloak sync job. A chunk that fails to store reports its
+# rows as "error" (safe to resend: existing users come back as "exists") and the upload carries on
+async def bulk_register_users(body, fmt: str):
+    counts = {"created": 0, "exists": 0, "invalid": 0, "error": 0}
+    chunk = []
+
+    async def flush():
+        try:
+            async with SessionLocal() as db:
+                lines = await _register_chunk(db, chunk)
+        except Exception as e:
+            logger.error(f"❌ Bulk registration chunk of {len(chunk)} rows failed: {e}")
+            lines = [
+                {"line": line_number, "status": "error", "error": "Could not store this row, send it again"}
+                for line_number, _row, _error in chunk
+            ]
+        for line in lines:
+            counts[line["status"]] += 1
+            yield json.dumps(line) + "\n"
+        chunk.clear()
+
+    async for line_number, row, error in iter_rows(body, fmt):
+        chunk.append((line_number, row, error))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            async for line in flush():
+                yield line
+    if chunk:
+        async for line in flush():
+            yield line
+
+    logger.info(f"📦 Bulk registration finished: {counts}")
+    yield json.dumps({"summary": counts}) + "\n"
+
+
+async def _register_chunk(db, chunk) -> list[dict]:
+    results = {}
+    valid = {}
+    seen = set()
+    for line_number, row, error in chunk:
+        if error is None:
+            try:
+                user = UserCreate(**row)
+            except ValidationError as e:
+                error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            except HTTPException as e:
+                error = e.detail
+        if error is not None:
+            results[line_number] = {"line": line_number, "status": "invalid", "error": error}
+        elif user.username in seen:
+            results[line_number] = {"line": line_number, "username": user.username, "status": "exists"}
+        else:
+            seen.add(user.username)
+            valid[line_number] = user
+
+    inserted = await insert_users_ignore_existing(db, list(valid.values()))
+    await add_users_to_filter([(user.username, user.email) for user in valid.values() if user.username in inserted])
+    await invalidate_profiles(inserted)
+
+    for line_number, user in valid.items():
+        status = "created" if user.username in inserted else "exists"
+        results[line_number] = {"line": line_number, "username": user.username, "status": status}
+    return [results[line_number] for line_number, _, _ in chunk]
@@ -0,0 +1,23 @@
+import logging
+from redis_cache.client import redis_client
+from config.settings import EMAIL_QUEUE_STREAM, EMAIL_QUEUE_MAXLEN, EMAIL_DEDUPE_WINDOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+DEDUPE_KEY_PREFIX = "user-service:password-email-dedupe:"
+
+
+# queue a password setup email; repeated requests for the same user within the window are dropped
+async def enqueue_password_email(username: str) -> bool:
+    dedupe_key = f"{DEDUPE_KEY_PREFIX}{username.lower()}"
+    if not await redis_client.set(dedupe_key, 1, nx=True, ex=EMAIL_DEDUPE_WINDOW_SECONDS):
+        logger.info("✉️ Password email for %s already queued, skipping duplicate", username)
+        return False
+
+    try:
+        await redis_client.xadd(EMAIL_QUEUE_STREAM, {"username": username}, maxlen=EMAIL_QUEUE_MAXLEN, approximate=True)
+    except Exception:
+        await redis_client.delete(dedupe_key)
+        raise
+    logger.info("✉️ Password email for %s queued", username)
+    return True
@@ -1,36 +1,121 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, func, tuple_, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.user_model import User
+from config.settings import SYNC_ATTEMPT_BACKOFF_SECONDS, SYNC_ATTEMPT_MAX_BACKOFF_SECONDS, SYNC_MAX_ATTEMPTS
 
 
-async def store_user_in_postgres(db: Session, user_data: dict) -> dict:
+def _user_row(user) -> dict:
+    return {
+        "username": user.username,
+        "email": user.email,
+        "firstname": user.firstName,
+        "lastname": user.lastName,
+        "password": None,
+        "synced": False,
+    }
 
-    # Convert camelCase to snake_case
-    user_data["firstname"] = user_data.pop("firstName")
-    user_data["lastname"] = user_data.pop("lastName")
 
-    # Create a User instance with correct model fields
-    db_user = User(
-        username=user_data["username"],
-        password=None,
-        email=user_data["email"],
-        firstname=user_data["firstname"],
-        lastname=user_data["lastname"]
+# single-row INSERT ... ON CONFLICT DO NOTHING in the caller's transaction (not committed);
+# False when the username or email is already taken
+async def insert_user_if_new(db: AsyncSession, user) -> bool:
+    result = await db.scalars(insert(User).values(_user_row(user)).on_conflict_do_nothing().returning(User.username))
+    return result.first() is not None
+
+
+# multi-row INSERT ... ON CONFLICT DO NOTHING, returns the usernames actually inserted
+async def insert_users_ignore_existing(db: AsyncSession, users: list) -> set[str]:
+    if not users:
+        return set()
+    rows = [_user_row(user) for user in users]
+    result = await db.scalars(insert(User).values(rows).on_conflict_do_nothing().returning(User.username))
+    inserted = set(result.all())
+    await db.commit()
+    return inserted
+
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    return await db.scalar(select(User).where(User.username == username))
+
+async def get_users_by_usernames(db: AsyncSession, usernames: list[str]):
+    result = await db.scalars(select(User).where(User.username.in_(usernames)))
+    return result.all()
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(User).where(User.email == email).limit(1))
+
+# rows that failed before wait out an exponential backoff; dead-lettered rows are not retried at all
+def _due_for_sync():
+    backoff = func.least(
+        SYNC_ATTEMPT_MAX_BACKOFF_SECONDS,
+        SYNC_ATTEMPT_BACKOFF_SECONDS * func.power(2, func.least(User.sync_attempts, 30) - 1),
+    )
+    return (
+        User.sync_attempts < SYNC_MAX_ATTEMPTS,
+        or_(
+            User.last_sync_attempt_at.is_(None),
+            func.extract("epoch", func.now() - User.last_sync_attempt_at) >= backoff,
+        ),
     )
 
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+# the sync backlog oldest first, in keyset-paginated pages (served by ix_users_unsynced)
+async def iter_unsynced_users(db: AsyncSession, page_size: int):
+    last_key = None
+    while True:
+        query = (
+            select(User)
+            .where(User.synced == False, *_due_for_sync())
+            .order_by(User.created_at, User.username)
+            .limit(page_size)
+        )
+        if last_key is not None:
+            query = query.where(tuple_(User.created_at, User.username) > last_key)
+        users = (await db.scalars(query)).all()
+        # end the read transaction so the connection goes back to the pool between pages
+        await db.commit()
+        if not users:
+            return
+        yield users
+        if len(users) < page_size:
+            return
+        last_key = (users[-1].created_at, users[-1].username)
+
+# (backlog size, oldest unsynced created_at, dead-lettered rows)
+async def get_unsynced_stats(db: AsyncSession):
+    result = await db.execute(
+        select(
+            func.count(),
+            func.min(User.created_at),
+            func.count().filter(User.sync_attempts >= SYNC_MAX_ATTEMPTS),
+        ).where(User.synced == False)
+    )
+    return result.one()
 
+async def mark_user_as_synced(db: AsyncSession, username: str):
+    await mark_users_as_synced(db, [username])
 
-def get_user_by_username(db: Session, username: str):
-    return db.query(User).filter(User.username == username).first()
+async def mark_users_as_synced(db: AsyncSession, usernames: list[str]):
+    await db.execute(
+        update(User)
+        .where(User.username.in_(usernames))
+        .values(
+            synced=True,
+            sync_attempts=User.sync_attempts + 1,
+            last_sync_error=None,
+            last_sync_attempt_at=func.now(),
+        )
+    )
+    await db.commit()
 
-def get_unsynced_users(db: Session):
-    return db.query(User).filter(User.synced == False).all()
+async def record_failed_sync_attempts(db: AsyncSession, usernames: list[str], error: str):
+    await db.execute(
+        update(User)
+        .where(User.username.in_(usernames))
+        .values(
+            sync_attempts=User.sync_attempts + 1,
+            last_sync_error=error[:1000],
+            last_sync_attempt_at=func.now(),
+        )
+    )
+    await db.commit()
 
-def mark_user_as_synced(db: Session, username: str):
-    user = db.query(User).filter(User.username == username).first()
-    if user:
-        user.synced = True
-        db.commit()
\ No newline at end of file
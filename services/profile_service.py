@@ -0,0 +1,27 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.postgres_service import get_users_by_usernames
+from redis_cache.profile_cache import get_cached_profiles, cache_profiles
+
+
+def user_profile(user) -> dict:
+    return {
+        "username": user.username,
+        "email": user.email,
+        "firstName": user.firstname,
+        "lastName": user.lastname,
+        "synced": bool(user.synced),
+    }
+
+
+# read-through lookup: redis first, then one postgres query for every miss (misses are cached too)
+async def get_user_profiles(db: AsyncSession, usernames: list[str]) -> dict:
+    usernames = list(dict.fromkeys(usernames))
+    profiles = await get_cached_profiles(usernames)
+
+    misses = [username for username in usernames if username not in profiles]
+    if misses:
+        loaded = {user.username: user_profile(user) for user in await get_users_by_usernames(db, misses)}
+        loaded = {username: loaded.get(username) for username in misses}
+        await cache_profiles(loaded)
+        profiles.update(loaded)
+    return profiles
@@ -0,0 +1,30 @@
+import logging
+from models.user_model import UserCreate
+from redis_cache.client import redis_client
+from redis_cache.user_cache import reserve_registration, release_registrations
+from config.settings import REGISTRATION_STREAM
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("username", "email", "firstName", "lastName")
+
+
+# reserve the username/email and append the registration to the stream drained by RegistrationFlusher;
+# False when a pending registration already holds the username or email
+async def enqueue_registration(user: UserCreate) -> bool:
+    if not await reserve_registration(user):
+        return False
+
+    data = user.model_dump()
+    try:
+        # never trimmed: entries are deleted by the flusher once they are in postgres
+        await redis_client.xadd(REGISTRATION_STREAM, {field: data[field] for field in FIELDS})
+    except Exception:
+        await release_registrations([user])
+        raise
+    logger.info("🕒 Registration for %s buffered", user.username)
+    return True
+
+
+def registration_from_entry(fields: dict) -> UserCreate:
+    return UserCreate(**{field: fields[field.encode()].decode() for field in FIELDS})
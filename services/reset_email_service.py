@@ -1,5 +1,6 @@
 from fastapi import HTTPException
 from auth.keycloak_auth import get_admin_token, get_user_id
+from redis_cache.user_id_cache import user_id_cache
 from utils.email_trigger import send_password_reset_email
 import logging
 
@@ -14,7 +15,15 @@ async def reset_password_email(username: str):
             logger.error(f"User '{username}' not found in Keycloak")
             raise HTTPException(status_code=404, detail=f"User '{username}' not found in Keycloak")
         
-        await send_password_reset_email(token, user_id)
+        try:
+            await send_password_reset_email(token, user_id)
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            # cached id is stale (user re-created in Keycloak), resolve it again once
+            await user_id_cache.invalidate(username)
+            user_id = await get_user_id(token, username)
+            await send_password_reset_email(token, user_id)
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
@@ -1,35 +1,101 @@
+import asyncio
+import httpx
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from models.user_model import UserCreate
-from services.postgres_service import store_user_in_postgres, get_user_by_username
+from services.postgres_service import insert_user_if_new, get_user_by_username, get_user_by_email
+from redis_cache.user_filter import might_exist, add_user_to_filter
+from redis_cache.profile_cache import invalidate_profiles
+from services.registration_queue import enqueue_registration
 from auth.keycloak_auth import keycloak_user_exists, reset_user_password
+from auth.keycloak_client import keycloak_unavailable
 import logging
 
 
 logger = logging.getLogger(__name__)
 
 
-async def register_user_data(user: UserCreate, db: Session):
-    # 1. Check if user exists in PostgreSQL
-    db_user = get_user_by_username(db, user.username)
-    if db_user:
-        raise HTTPException(status_code=400, detail="User already exists in PostgreSQL")
-    # 2. Check if user exists in Keycloak
-    keycloak_user = await keycloak_user_exists(user.username)
+# one INSERT ... ON CONFLICT DO NOTHING (the unique username/email indexes settle races between
+# concurrent registrations) overlapped with the Keycloak check; the insert commits only if both pass
+async def register_user_data(user: UserCreate, db: AsyncSession):
+    # A Redis filter miss means neither Postgres nor (per the last reconcile run) Keycloak has the name
+    username_taken, _ = await might_exist(user.username, user.email)
+    keycloak_check = asyncio.create_task(keycloak_user_exists(user.username)) if username_taken else None
+
+    try:
+        inserted = await insert_user_if_new(db, user)
+        keycloak_user = await keycloak_check if keycloak_check is not None else False
+    except HTTPException:
+        await db.rollback()
+        raise
+    except httpx.RequestError as e:
+        await db.rollback()
+        logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
+        raise keycloak_unavailable(e)
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Registration failed")
+    finally:
+        if keycloak_check is not None and not keycloak_check.done():
+            keycloak_check.cancel()
+
+    if not inserted:
+        taken_by_username = await get_user_by_username(db, user.username)
+        await db.rollback()
+        if taken_by_username:
+            raise HTTPException(status_code=400, detail="User already exists in PostgreSQL")
+        raise HTTPException(status_code=400, detail="Email already registered")
     if keycloak_user:
+        await db.rollback()
         raise HTTPException(status_code=400, detail="User already exists in Keycloak")
+
     try:
-        # Save user in PostgreSQL without password
-        await store_user_in_postgres(db, user.dict())
-        logger.info(f"User {user.username} stored in DB. Password setup email triggered.")
-        return {"message": f"User {user.username} registered successfully"} 
+        await db.commit()
     except Exception as e:
         logger.error(f"Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Registration failed")
+    await add_user_to_filter(user.username, user.email)
+    await invalidate_profiles([user.username])
+    logger.info("User %s stored in DB. Password setup email triggered.", user.username)
+    return {"message": f"User {user.username} registered successfully"}
+
+
+# write-behind registration: same checks, then the user is buffered on a redis stream for the flusher
+async def buffer_user_registration(user: UserCreate, db: AsyncSession):
+    await ensure_user_is_new(user, db)
+    try:
+        queued = await enqueue_registration(user)
+    except Exception as e:
+        logger.error(f"Error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Registration failed")
+    if not queued:
+        raise HTTPException(status_code=400, detail="A registration for this username or email is already pending")
+    return {"message": f"User {user.username} registration accepted"}
+
+
+async def ensure_user_is_new(user: UserCreate, db: AsyncSession):
+    # 0. Ask the Redis filter first; a miss means the name/email is definitely free
+    username_taken, email_taken = await might_exist(user.username, user.email)
+    if username_taken:
+        # 1. Check if user exists in PostgreSQL
+        db_user = await get_user_by_username(db, user.username)
+        if db_user:
+            raise HTTPException(status_code=400, detail="User already exists in PostgreSQL")
+        # 2. Check if user exists in Keycloak
+        try:
+            keycloak_user = await keycloak_user_exists(user.username)
+        except httpx.RequestError as e:
+            logger.error(f"🔌 Connection error with Keycloak: {str(e)}")
+            raise keycloak_unavailable(e)
+        if keycloak_user:
+            raise HTTPException(status_code=400, detail="User already exists in Keycloak")
+    if email_taken and await get_user_by_email(db, user.email):
+        raise HTTPException(status_code=400, detail="Email already registered")
     
 
 # reset the password
-async def handle_password_reset(username: str, new_password: str, db: Session):
+async def handle_password_reset(username: str, new_password: str, db: AsyncSession):
     await reset_user_password(username, new_password)
     return {"message": "Password updated successfully"}
 
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+import socket
+from redis.exceptions import ResponseError
+from redis_cache.client import redis_client, blocking_redis_client
+from services.reset_email_service import reset_password_email
+from tasks.sync_to_keycloak import is_retryable
+from config.settings import (
+    EMAIL_QUEUE_STREAM,
+    EMAIL_QUEUE_GROUP,
+    EMAIL_WORKER_CONCURRENCY,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_RETRY_DELAY_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+ATTEMPTS_KEY = f"{EMAIL_QUEUE_STREAM}:attempts"
+READ_BLOCK_MS = 5000
+ERROR_DELAY_SECONDS = 5
+
+
+class EmailWorker:
+    """
+    Drains the password-email stream through a consumer group with at most
+    EMAIL_WORKER_CONCURRENCY sends in flight. A failed send stays pending and is
+    reclaimed (from this or a crashed worker) after EMAIL_RETRY_DELAY_SECONDS, until
+    EMAIL_MAX_ATTEMPTS is reached.
+    """
+
+    def __init__(self):
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._slots = asyncio.Semaphore(EMAIL_WORKER_CONCURRENCY)
+        self._in_flight = set()
+        self._deliveries = set()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._ensure_group()
+                break
+            except Exception as e:
+                logger.error(f"❌ Could not create email consumer group: {e}")
+                await asyncio.sleep(ERROR_DELAY_SECONDS)
+
+        logger.info(f"✉️ Email worker {self._consumer} started")
+        while True:
+            try:
+                await self._dispatch(await self._reclaim())
+                entries = await blocking_redis_client.xreadgroup(
+                    EMAIL_QUEUE_GROUP,
+                    self._consumer,
+                    {EMAIL_QUEUE_STREAM: ">"},
+                    count=EMAIL_WORKER_CONCURRENCY,
+                    block=READ_BLOCK_MS,
+                )
+                for _stream, messages in entries or []:
+                    await self._dispatch(messages)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Email worker error: {e}")
+                await asyncio.sleep(ERROR_DELAY_SECONDS)
+
+    async def _ensure_group(self):
+        try:
+            await redis_client.xgroup_create(EMAIL_QUEUE_STREAM, EMAIL_QUEUE_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    # take over messages left pending past the retry delay (failed sends or crashed consumers)
+    async def _reclaim(self) -> list:
+        _next_id, messages, *_ = await redis_client.xautoclaim(
+            EMAIL_QUEUE_STREAM,
+            EMAIL_QUEUE_GROUP,
+            self._consumer,
+            min_idle_time=EMAIL_RETRY_DELAY_SECONDS * 1000,
+            count=EMAIL_WORKER_CONCURRENCY,
+        )
+        return messages
+
+    async def _dispatch(self, messages):
+        for message_id, fields in messages:
+            if not fields or message_id in self._in_flight:
+                continue
+            await self._slots.acquire()
+            self._in_flight.add(message_id)
+            delivery = asyncio.create_task(self._deliver(message_id, fields))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, message_id, fields):
+        username = fields[b"username"].decode()
+        try:
+            await reset_password_email(username)
+            await self._ack(message_id)
+        except Exception as e:
+            attempts = await redis_client.hincrby(ATTEMPTS_KEY, message_id, 1)
+            if attempts >= EMAIL_MAX_ATTEMPTS or not is_retryable(e):
+                logger.error(f"❌ Giving up on password email for {username} after {attempts} attempt(s): {e}")
+                await self._ack(message_id)
+            else:
+                logger.warning(f"✉️ Password email for {username} failed (attempt {attempts}), will retry: {e}")
+        finally:
+            self._in_flight.discard(message_id)
+            self._slots.release()
+
+    async def _ack(self, message_id):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xack(EMAIL_QUEUE_STREAM, EMAIL_QUEUE_GROUP, message_id)
+            pipe.xdel(EMAIL_QUEUE_STREAM, message_id)
+            pipe.hdel(ATTEMPTS_KEY, message_id)
+            await pipe.execute()
@@ -0,0 +1,194 @@
+"""
+Reconciles the users table with the Keycloak realm.
+
+    python -m tasks.reconcile_keycloak --dry-run
+
+Pages through the realm with the admin API into a temporary table on the job's
+Postgres connection, then lets Postgres join it against users:
+
+- users Keycloak has but Postgres still marks unsynced are marked synced
+- users marked synced that Keycloak no longer has are re-queued (synced = false)
+  and the sync is woken up to recreate them
+- realm users unknown to Postgres (created out of band) are only reported
+
+Each page is committed before the next one is fetched and repairs run in batches of
+RECONCILE_BATCH_SIZE rows, each in its own short transaction, so no transaction stays
+open across Keycloak calls and only counts and samples are kept in memory. Users added
+to the realm while it is paged may be missed; the sync's exists check makes re-queuing
+them harmless.
+"""
+import argparse
+import asyncio
+import json
+import logging
+from dataclasses import dataclass, field, asdict
+from sqlalchemy import text
+from auth.keycloak_auth import list_keycloak_users
+from auth.keycloak_client import start_keycloak_client, close_keycloak_client
+from db.postgres import engine
+from redis_cache.client import close_redis
+from redis_cache.profile_cache import invalidate_profiles
+from redis_cache.user_id_cache import user_id_cache
+from redis_cache.user_filter import add_usernames_to_filter, mark_keycloak_usernames_loaded
+from logs.logging_config import setup_logger
+from config.settings import (
+    RECONCILE_PAGE_SIZE,
+    RECONCILE_BATCH_SIZE,
+    RECONCILE_REPORT_SAMPLE_SIZE,
+    SYNC_NOTIFY_CHANNEL,
+)
+
+logger = logging.getLogger(__name__)
+
+SERVICE_ACCOUNT_PREFIX = "service-account-"
+
+# keycloak stores usernames lowercased
+UNSYNCED_IN_KEYCLOAK = """
+    SELECT u.username FROM users u
+    JOIN keycloak_users k ON k.username = lower(u.username)
+    WHERE u.synced IS NOT TRUE
+"""
+SYNCED_MISSING_FROM_KEYCLOAK = """
+    SELECT u.username FROM users u
+    WHERE u.synced AND NOT EXISTS (SELECT 1 FROM keycloak_users k WHERE k.username = lower(u.username))
+"""
+KEYCLOAK_ONLY = """
+    SELECT k.username FROM keycloak_users k
+    WHERE NOT EXISTS (SELECT 1 FROM users u WHERE lower(u.username) = k.username)
+"""
+
+
+@dataclass
+class ReconcileReport:
+    dry_run: bool
+    keycloak_users: int = 0
+    marked_synced: int = 0
+    requeued: int = 0
+    keycloak_only: int = 0
+    samples: dict = field(default_factory=dict)
+
+
+async def reconcile(dry_run: bool) -> ReconcileReport:
+    report = ReconcileReport(dry_run=dry_run)
+    # a temp table only exists on the connection that created it, so the job keeps one connection
+    # for its whole run and commits as it goes instead of holding one transaction open
+    async with engine.connect() as conn:
+        await conn.execute(text("CREATE TEMP TABLE keycloak_users (username TEXT PRIMARY KEY, id TEXT NOT NULL)"))
+        await conn.commit()
+        try:
+            report.keycloak_users = await load_keycloak_users(conn)
+            await conn.execute(text("ANALYZE keycloak_users"))
+            await conn.commit()
+
+            report.keycloak_only, report.samples["keycloak_only"] = await count_and_sample(conn, KEYCLOAK_ONLY)
+            if dry_run:
+                report.marked_synced, report.samples["marked_synced"] = await count_and_sample(conn, UNSYNCED_IN_KEYCLOAK)
+                report.requeued, report.samples["requeued"] = await count_and_sample(conn, SYNCED_MISSING_FROM_KEYCLOAK)
+                return report
+
+            report.marked_synced, report.samples["marked_synced"] = await set_synced(conn, UNSYNCED_IN_KEYCLOAK, True, None)
+            report.requeued, report.samples["requeued"] = await set_synced(
+                conn, SYNCED_MISSING_FROM_KEYCLOAK, False, "missing from Keycloak (reconcile)"
+            )
+            if report.requeued:
+                # the insert trigger is what normally wakes the sync listener
+                await conn.execute(text("SELECT pg_notify(:channel, '')"), {"channel": SYNC_NOTIFY_CHANNEL})
+                await conn.commit()
+        finally:
+            # the connection goes back to the pool, so don't leave the table on it
+            await conn.rollback()
+            await conn.execute(text("DROP TABLE IF EXISTS keycloak_users"))
+            await conn.commit()
+    return report
+
+
+async def load_keycloak_users(conn) -> int:
+    loaded = 0
+    first = 0
+    while True:
+        page = await list_keycloak_users(first, RECONCILE_PAGE_SIZE)
+        rows = [
+            {"username": user["username"].lower(), "id": user["id"]}
+            for user in page
+            if not user["username"].startswith(SERVICE_ACCOUNT_PREFIX)
+        ]
+        if rows:
+            await conn.execute(
+                text("INSERT INTO keycloak_users (username, id) VALUES (:username, :id) ON CONFLICT DO NOTHING"),
+                rows,
+            )
+            await conn.commit()
+            # registration only trusts a filter miss to mean "not in Keycloak" once every realm user is in it
+            await add_usernames_to_filter([row["username"] for row in rows])
+        loaded += len(rows)
+        first += len(page)
+        if len(page) < RECONCILE_PAGE_SIZE:
+            await mark_keycloak_usernames_loaded()
+            logger.info("🔎 Loaded %d realm users for reconciliation", loaded)
+            return loaded
+
+
+async def count_and_sample(conn, query: str) -> tuple[int, list[str]]:
+    # a full scan of users; don't let the request statement_timeout cut it off
+    await conn.execute(text("SET LOCAL statement_timeout = 0"))
+    count = await conn.scalar(text(f"SELECT count(*) FROM ({query}) diff"))
+    sample = (await conn.scalars(text(f"{query} LIMIT :limit"), {"limit": RECONCILE_REPORT_SAMPLE_SIZE})).all()
+    await conn.commit()
+    return count, list(sample)
+
+
+# update the rows matched by `query` in username order, RECONCILE_BATCH_SIZE per transaction;
+# cached profiles (and, for re-queued users, cached Keycloak ids) are dropped after each batch
+async def set_synced(conn, query: str, synced: bool, error: str | None) -> tuple[int, list[str]]:
+    count = 0
+    sample = []
+    after = ""
+    while True:
+        # one batch may still scan far past `after` when the drift is sparse
+        await conn.execute(text("SET LOCAL statement_timeout = 0"))
+        result = await conn.scalars(
+            text(f"""
+                WITH batch AS (
+                    SELECT username FROM ({query}) diff
+                    WHERE username > :after
+                    ORDER BY username
+                    LIMIT :limit
+                ), updated AS (
+                    UPDATE users SET synced = :synced, last_sync_error = :error, sync_attempts = 0
+                    WHERE username IN (SELECT username FROM batch)
+                    RETURNING username
+                )
+                SELECT username FROM updated ORDER BY username
+            """),
+            {"after": after, "limit": RECONCILE_BATCH_SIZE, "synced": synced, "error": error},
+        )
+        usernames = list(result.all())
+        await conn.commit()
+        if not usernames:
+            return count, sample
+
+        count += len(usernames)
+        sample.extend(usernames[:RECONCILE_REPORT_SAMPLE_SIZE - len(sample)])
+        after = usernames[-1]
+        await invalidate_profiles(usernames)
+        if not synced:
+            await user_id_cache.invalidate_many(usernames)
+        logger.info("🔎 Set synced=%s on %d users (%d so far)", synced, len(usernames), count)
+
+
+async def main(dry_run: bool):
+    setup_logger()
+    await start_keycloak_client()
+    try:
+        report = await reconcile(dry_run)
+    finally:
+        await close_keycloak_client()
+        await close_redis()
+        await engine.dispose()
+    print(json.dumps(asdict(report), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile Postgres users with the Keycloak realm")
+    parser.add_argument("--dry-run", action="store_true", help="report the differences without repairing them")
+    asyncio.run(main(parser.parse_args().dry_run))
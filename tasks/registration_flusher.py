@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from redis.exceptions import ResponseError
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from db.postgres import SessionLocal
+from redis_cache.client import redis_client, blocking_redis_client
+from redis_cache.user_cache import release_registrations
+from redis_cache.user_filter import add_users_to_filter
+from redis_cache.profile_cache import invalidate_profiles
+from services.postgres_service import insert_users_ignore_existing
+from services.registration_queue import registration_from_entry
+from utils.metrics import REGISTRATION_BUFFER_PENDING, REGISTRATION_BUFFER_LAG_SECONDS, REGISTRATION_FLUSHED
+from config.settings import (
+    REGISTRATION_STREAM,
+    REGISTRATION_GROUP,
+    REGISTRATION_FLUSH_BATCH_SIZE,
+    REGISTRATION_FLUSH_RETRY_SECONDS,
+    REGISTRATION_FLUSH_MAX_ATTEMPTS,
+    REGISTRATION_DEAD_LETTER_STREAM,
+)
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_MS = 1000
+ERROR_DELAY_SECONDS = 5
+ATTEMPTS_KEY = f"{REGISTRATION_STREAM}:attempts"
+DEAD_LETTER_MAXLEN = 100_000
+
+
+# lost connections and pool/statement timeouts are worth retrying as a batch; anything else is blamed on the rows
+def is_transient_db_error(error: Exception) -> bool:
+    if isinstance(error, (OperationalError, InterfaceError, PoolTimeoutError, TimeoutError, OSError)):
+        return True
+    return isinstance(error, DBAPIError) and error.connection_invalidated
+
+
+class RegistrationFlusher:
+    """
+    Drains the write-behind registration stream through a consumer group, inserting up
+    to REGISTRATION_FLUSH_BATCH_SIZE users per statement. Entries are acknowledged and
+    deleted only after the insert commits; a failed batch stays pending and is reclaimed
+    (by this or another worker) after REGISTRATION_FLUSH_RETRY_SECONDS. A batch Postgres rejects
+    is retried one row at a time, and rejected rows, or entries that fail
+    REGISTRATION_FLUSH_MAX_ATTEMPTS flushes, go to REGISTRATION_DEAD_LETTER_STREAM.
+    """
+
+    def __init__(self):
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self._ensure_group()
+                break
+            except Exception as e:
+                logger.error(f"❌ Could not create registration consumer group: {e}")
+                await asyncio.sleep(ERROR_DELAY_SECONDS)
+
+        logger.info(f"🕒 Registration flusher {self._consumer} started")
+        while True:
+            try:
+                messages = await self._reclaim()
+                if not messages:
+                    entries = await blocking_redis_client.xreadgroup(
+                        REGISTRATION_GROUP,
+                        self._consumer,
+                        {REGISTRATION_STREAM: ">"},
+                        count=REGISTRATION_FLUSH_BATCH_SIZE,
+                        block=READ_BLOCK_MS,
+                    )
+                    messages = [message for _stream, batch in entries or [] for message in batch]
+                if messages:
+                    await self._flush(messages)
+                await self._update_lag()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Registration flush failed: {e}")
+                await asyncio.sleep(ERROR_DELAY_SECONDS)
+
+    async def _ensure_group(self):
+        try:
+            await redis_client.xgroup_create(REGISTRATION_STREAM, REGISTRATION_GROUP, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    # take over batches left pending by a failed flush or a crashed worker
+    async def _reclaim(self) -> list:
+        _next_id, messages, *_ = await redis_client.xautoclaim(
+            REGISTRATION_STREAM,
+            REGISTRATION_GROUP,
+            self._consumer,
+            min_idle_time=REGISTRATION_FLUSH_RETRY_SECONDS * 1000,
+            count=REGISTRATION_FLUSH_BATCH_SIZE,
+        )
+        return [(message_id, fields) for message_id, fields in messages if fields]
+
+    async def _flush(self, messages):
+        users = {}
+        for message_id, fields in messages:
+            try:
+                user = registration_from_entry(fields)
+            except Exception as e:
+                logger.error(f"❌ Dropping unreadable buffered registration {message_id}: {e}")
+                REGISTRATION_FLUSHED.labels(outcome="invalid").inc()
+                continue
+            users.setdefault(user.username, user)
+
+        try:
+            inserted, rejected = await self._insert_batch(list(users.values()))
+        except Exception as e:
+            await self._record_failed_attempt(messages, e)
+            raise
+
+        # rows that already existed are in postgres too, and may be missing from the filter after a retried flush
+        await add_users_to_filter([(user.username, user.email) for user in users.values() if user.username not in rejected])
+        await invalidate_profiles(inserted)
+        await release_registrations(list(users.values()))
+
+        REGISTRATION_FLUSHED.labels(outcome="inserted").inc(len(inserted))
+        REGISTRATION_FLUSHED.labels(outcome="exists").inc(len(users) - len(inserted) - len(rejected))
+        logger.info("🕒 Flushed %d buffered registrations (%d new)", len(messages), len(inserted))
+
+        if rejected:
+            await self._dead_letter([
+                (message_id, fields, rejected[fields[b"username"].decode()])
+                for message_id, fields in messages
+                if fields.get(b"username", b"").decode() in rejected
+            ])
+        await self._ack([message_id for message_id, _fields in messages])
+
+    # returns the inserted usernames and, if Postgres refused the batch, the rows it refused with their error
+    async def _insert_batch(self, users) -> tuple[set[str], dict[str, str]]:
+        try:
+            return await self._insert(users), {}
+        except Exception as e:
+            if is_transient_db_error(e):
+                raise
+            logger.warning(f"⚠️ Batch of {len(users)} buffered registrations rejected, inserting them one at a time: {e}")
+        return await self._insert_each(users)
+
+    async def _insert(self, users) -> set[str]:
+        async with SessionLocal() as db:
+            return await insert_users_ignore_existing(db, users)
+
+    # isolate the rows Postgres refuses; a transient error aborts and leaves the whole batch pending
+    async def _insert_each(self, users) -> tuple[set[str], dict[str, str]]:
+        inserted = set()
+        rejected = {}
+        for user in users:
+            try:
+                inserted |= await self._insert([user])
+            except Exception as e:
+                if is_transient_db_error(e):
+                    raise
+                logger.error(f"❌ Postgres rejected buffered registration for {user.username}: {e}")
+                rejected[user.username] = str(e) or type(e).__name__
+        return inserted, rejected
+
+    # count the failed flush per entry; entries out of attempts are dead-lettered instead of retried
+    async def _record_failed_attempt(self, messages, error: Exception):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for message_id, _fields in messages:
+                pipe.hincrby(ATTEMPTS_KEY, message_id, 1)
+            attempts = await pipe.execute()
+
+        exhausted = [
+            (message_id, fields, f"gave up after {count} attempts: {error}")
+            for (message_id, fields), count in zip(messages, attempts)
+            if count >= REGISTRATION_FLUSH_MAX_ATTEMPTS
+        ]
+        if exhausted:
+            users = []
+            for _message_id, fields, _error in exhausted:
+                try:
+                    users.append(registration_from_entry(fields))
+                except Exception:
+                    pass
+            await self._dead_letter(exhausted)
+            await release_registrations(users)
+            await self._ack([message_id for message_id, _fields, _error in exhausted])
+
+    # the 202 was already sent for these, so keep them (with the error) for an operator to replay
+    async def _dead_letter(self, entries):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            for message_id, fields, error in entries:
+                pipe.xadd(
+                    REGISTRATION_DEAD_LETTER_STREAM,
+                    {**fields, b"message_id": message_id, b"error": error[:1000]},
+                    maxlen=DEAD_LETTER_MAXLEN,
+                    approximate=True,
+                )
+            await pipe.execute()
+        REGISTRATION_FLUSHED.labels(outcome="dead_letter").inc(len(entries))
+        logger.error(f"❌ Moved {len(entries)} buffered registrations to {REGISTRATION_DEAD_LETTER_STREAM}")
+
+    async def _ack(self, message_ids):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xack(REGISTRATION_STREAM, REGISTRATION_GROUP, *message_ids)
+            pipe.xdel(REGISTRATION_STREAM, *message_ids)
+            pipe.hdel(ATTEMPTS_KEY, *message_ids)
+            await pipe.execute()
+
+    # acknowledged entries are deleted, so the stream holds exactly the unflushed backlog
+    async def _update_lag(self):
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.xlen(REGISTRATION_STREAM)
+            pipe.xrange(REGISTRATION_STREAM, count=1)
+            pending, oldest = await pipe.execute()
+        REGISTRATION_BUFFER_PENDING.set(pending)
+        if oldest:
+            oldest_ms = int(oldest[0][0].split(b"-")[0])
+            REGISTRATION_BUFFER_LAG_SECONDS.set(max(0.0, time.time() - oldest_ms / 1000))
+        else:
+            REGISTRATION_BUFFER_LAG_SECONDS.set(0)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import asyncpg
+from db.postgres import ASYNCPG_DSN
+from config.settings import SYNC_LEADER_RETRY_SECONDS
+from utils.metrics import SYNC_LEADER
+
+logger = logging.getLogger(__name__)
+
+# session-level advisory lock held by the one process that runs the Keycloak sync
+SYNC_LEADER_LOCK_ID = 4_242_001
+HEALTH_CHECK_SECONDS = 10
+RECONNECT_DELAY_SECONDS = 5
+
+
+class SyncLeader:
+    """
+    Competes for a Postgres advisory lock on a dedicated connection. The holder calls
+    `on_elected` and keeps the lock until its connection drops or it stops, then calls
+    `on_demoted`; every other worker retries every SYNC_LEADER_RETRY_SECONDS.
+    """
+
+    def __init__(self, on_elected, on_demoted):
+        self._on_elected = on_elected
+        self._on_demoted = on_demoted
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                conn = await asyncpg.connect(ASYNCPG_DSN)
+            except Exception as e:
+                logger.error(f"🔌 Sync leader election could not connect to Postgres: {e}")
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            try:
+                while not await conn.fetchval("SELECT pg_try_advisory_lock($1)", SYNC_LEADER_LOCK_ID):
+                    await asyncio.sleep(SYNC_LEADER_RETRY_SECONDS)
+                await self._lead(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Sync leadership lost: {e}")
+            finally:
+                if not conn.is_closed():
+                    conn.terminate()
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def _lead(self, conn):
+        logger.info("👑 This worker is now the sync leader")
+        SYNC_LEADER.set(1)
+        await self._on_elected()
+        try:
+            # the lock lives as long as the session, so a dead connection means someone else may lead
+            while True:
+                await asyncio.sleep(HEALTH_CHECK_SECONDS)
+                await asyncio.wait_for(conn.fetchval("SELECT 1"), timeout=HEALTH_CHECK_SECONDS)
+        finally:
+            SYNC_LEADER.set(0)
+            await self._on_demoted()
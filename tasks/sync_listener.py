@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import asyncpg
+from db.postgres import ASYNCPG_DSN
+from config.settings import SYNC_NOTIFY_CHANNEL, SYNC_NOTIFY_DEBOUNCE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# how often an idle listener checks that its connection is still alive
+HEALTH_CHECK_SECONDS = 30
+RECONNECT_DELAY_SECONDS = 5
+
+
+class SyncListener:
+    """
+    LISTENs on the users insert channel and calls `on_notify` shortly after a NOTIFY.
+    Notifications arriving within SYNC_NOTIFY_DEBOUNCE_SECONDS of each other (or while
+    a run is in progress) collapse into a single call.
+    """
+
+    def __init__(self, on_notify):
+        self._on_notify = on_notify
+        self._pending = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                conn = await asyncpg.connect(ASYNCPG_DSN)
+            except Exception as e:
+                logger.error(f"🔌 Sync listener could not connect to Postgres: {e}")
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            try:
+                await conn.add_listener(SYNC_NOTIFY_CHANNEL, self._notified)
+                logger.info(f"👂 Listening for new users on '{SYNC_NOTIFY_CHANNEL}'")
+                # pick up anything inserted while we were not listening
+                self._pending.set()
+                await self._dispatch(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Sync listener failed: {e}")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def _dispatch(self, conn):
+        while not conn.is_closed():
+            try:
+                await asyncio.wait_for(self._pending.wait(), timeout=HEALTH_CHECK_SECONDS)
+            except asyncio.TimeoutError:
+                continue
+
+            await asyncio.sleep(SYNC_NOTIFY_DEBOUNCE_SECONDS)
+            self._pending.clear()
+            try:
+                await self._on_notify()
+            except Exception as e:
+                logger.error(f"❌ Sync triggered by NOTIFY failed: {e}")
+
+        logger.warning("🔌 Sync listener connection closed, reconnecting")
+
+    def _notified(self, connection, pid, channel, payload):
+        self._pending.set()
@@ -1,39 +1,239 @@
-from db.postgres import SessionLocal
-from auth.keycloak_auth import keycloak_user_exists, sync_user_to_keycloak
-from services.postgres_service import get_unsynced_users
-from services.reset_email_service import reset_password_email
+import asyncio
+import random
+import time
 import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import httpx
+from fastapi import HTTPException
+from auth.circuit_breaker import CircuitOpenError, keycloak_breaker
+from db.postgres import SessionLocal
+from auth.keycloak_auth import keycloak_user_exists, sync_user_to_keycloak, import_users_to_keycloak
+from services.postgres_service import iter_unsynced_users, get_unsynced_stats, mark_users_as_synced, record_failed_sync_attempts
+from utils.metrics import SYNC_BACKLOG_USERS, SYNC_OLDEST_UNSYNCED_SECONDS, SYNC_DEAD_LETTER_USERS, SYNC_RUN_SECONDS, SYNC_USERS
+from services.email_queue import enqueue_password_email
+from redis_cache.profile_cache import invalidate_profiles
+from redis_cache.user_filter import add_usernames_to_filter
+from config.settings import (
+    SYNC_CONCURRENCY,
+    SYNC_MAX_RETRIES,
+    SYNC_RETRY_BACKOFF_SECONDS,
+    SYNC_RETRY_MAX_BACKOFF_SECONDS,
+    SYNC_MODE,
+    SYNC_BATCH_SIZE,
+    SYNC_PAGE_SIZE,
+    SYNC_MAX_ATTEMPTS,
+)
 
 logger = logging.getLogger(__name__)
 
+# the poll and the NOTIFY listener both trigger runs; never let two overlap
+_sync_lock = asyncio.Lock()
 
-async def sync_unsynced_users():
-    db = SessionLocal()
-    users = get_unsynced_users(db)
 
-    if not users:
-        logger.info(f"No users to sync")
+@dataclass
+class SyncSummary:
+    synced: int = 0
+    skipped: int = 0
+    failed: int = 0
+    duration: float = 0.0
+    # unsynced rows that reached SYNC_MAX_ATTEMPTS, after the run
+    dead_lettered: int = 0
 
-    for user in users:
-        try: 
-            logger.info(f"🔁 Syncing {user.username} to Keycloak")
-            if await keycloak_user_exists(user.username):
-                logger.warning(f"🔁 Skipping {user.username}: already exists in Keycloak")
-                user.synced = True    # Optional: Mark as synced to stop retrying
-                db.commit()
-                continue
 
-            await sync_user_to_keycloak(user)  # This should create the user in Keycloak
-            user.synced = True
-            db.commit()
-            logger.info(f"✅ Synced {user.username} to Keycloak")
+async def run_sync() -> SyncSummary:
+    async with _sync_lock:
+        dead_lettered = await update_backlog_metrics()
+        summary = await sync_unsynced_users()
+        if summary.synced or summary.skipped or summary.failed:
+            SYNC_RUN_SECONDS.observe(summary.duration)
+            for outcome in ("synced", "skipped", "failed"):
+                SYNC_USERS.labels(outcome=outcome).inc(getattr(summary, outcome))
+            dead_lettered = await update_backlog_metrics()
+            if dead_lettered:
+                logger.warning(
+                    f"🪦 {dead_lettered} users reached {SYNC_MAX_ATTEMPTS} sync attempts and are no longer retried "
+                    "(see last_sync_error; reset sync_attempts to requeue them)"
+                )
+        summary.dead_lettered = dead_lettered
+        return summary
+
+
+# refresh the backlog gauges; returns the number of dead-lettered rows
+async def update_backlog_metrics() -> int:
+    try:
+        async with SessionLocal() as db:
+            backlog, oldest, dead_lettered = await get_unsynced_stats(db)
+    except Exception as e:
+        logger.warning(f"Could not read sync backlog: {e}")
+        return 0
+    SYNC_BACKLOG_USERS.set(backlog)
+    SYNC_OLDEST_UNSYNCED_SECONDS.set((datetime.now(timezone.utc) - oldest).total_seconds() if oldest else 0)
+    SYNC_DEAD_LETTER_USERS.set(dead_lettered)
+    return dead_lettered
+
+
+async def sync_unsynced_users() -> SyncSummary:
+    started = time.perf_counter()
+    summary = SyncSummary()
+
+    # don't pile more work onto a Keycloak that is already failing
+    if keycloak_breaker.is_open:
+        logger.warning("⏸️ Keycloak circuit open, skipping sync run")
+        return summary
 
-            await reset_password_email(user.username)
+    # acquired before a worker is created, so pages are read only as fast as they are synced
+    semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
 
+    async def user_worker(user):
+        try:
+            outcome = await run_with_retry(lambda: sync_user(user), [user.username])
         except Exception as e:
             logger.error(f"❌ Failed to sync {user.username}: {e}")
+            outcome = "failed"
+        finally:
+            semaphore.release()
+        setattr(summary, outcome, getattr(summary, outcome) + 1)
+
+    async def batch_worker(batch):
+        usernames = [user.username for user in batch]
+        try:
+            outcomes = await run_with_retry(lambda: sync_batch(batch), usernames)
+        except HTTPException as e:
+            if is_retryable(e):
+                logger.error(f"❌ Failed to sync batch of {len(batch)} users: {e.detail}")
+                outcomes = ["failed"] * len(batch)
+            else:
+                # partialImport rejects the whole batch for one bad row; isolate it one user at a time
+                logger.warning(f"🔁 Batch of {len(batch)} users rejected ({e.status_code}), syncing them one by one")
+                outcomes = [await sync_user_in_batch(user) for user in batch]
+        except Exception as e:
+            logger.error(f"❌ Failed to sync batch of {len(batch)} users: {e}")
+            outcomes = ["failed"] * len(batch)
+        finally:
+            semaphore.release()
+        for outcome in outcomes:
+            setattr(summary, outcome, getattr(summary, outcome) + 1)
+
+    async with asyncio.TaskGroup() as group:
+        async with SessionLocal() as db:
+            async for page in iter_unsynced_users(db, SYNC_PAGE_SIZE):
+                if SYNC_MODE == "batch":
+                    for i in range(0, len(page), SYNC_BATCH_SIZE):
+                        await semaphore.acquire()
+                        group.create_task(batch_worker(page[i:i + SYNC_BATCH_SIZE]))
+                else:
+                    for user in page:
+                        await semaphore.acquire()
+                        group.create_task(user_worker(user))
+
+    if not (summary.synced or summary.skipped or summary.failed):
+        logger.info("No users to sync")
+        return summary
+
+    summary.duration = time.perf_counter() - started
+    logger.info(
+        f"🔁 Sync run finished: synced={summary.synced} skipped={summary.skipped} "
+        f"failed={summary.failed} duration={summary.duration:.2f}s"
+    )
+    return summary
+
+
+# run a sync operation, retrying transient Keycloak failures with jittered exponential backoff;
+# every failed attempt is recorded on the affected rows
+async def run_with_retry(operation, usernames: list[str]):
+    for attempt in range(1, SYNC_MAX_RETRIES + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            async with SessionLocal() as db:
+                await record_failed_sync_attempts(db, usernames, str(e) or type(e).__name__)
+
+            if attempt == SYNC_MAX_RETRIES or not is_retryable(e):
+                raise
+
+            delay = min(SYNC_RETRY_MAX_BACKOFF_SECONDS, SYNC_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+            delay *= random.uniform(0.5, 1.5)
+            logger.warning(f"🔁 Retrying sync of {len(usernames)} user(s) in {delay:.2f}s (attempt {attempt} failed: {e})")
+            await asyncio.sleep(delay)
+
+
+# per-user fallback for a rejected batch; each failure is recorded on that user's row only
+async def sync_user_in_batch(user) -> str:
+    try:
+        return await run_with_retry(lambda: sync_user(user), [user.username])
+    except Exception as e:
+        logger.error(f"❌ Failed to sync {user.username}: {e}")
+        return "failed"
+
+
+async def sync_user(user) -> str:
+    logger.info(f"🔁 Syncing {user.username} to Keycloak")
+    if await keycloak_user_exists(user.username):
+        logger.warning(f"🔁 Skipping {user.username}: already exists in Keycloak")
+        await mark_synced([user.username])    # Mark as synced to stop retrying
+        await add_usernames_to_filter([user.username])
+        return "skipped"
+
+    await sync_user_to_keycloak(user)  # This should create the user in Keycloak
+    await mark_synced([user.username])
+    logger.info(f"✅ Synced {user.username} to Keycloak")
+
+    await send_setup_email(user.username)
+    return "synced"
+
+
+# flag rows as synced and drop their cached profiles, which carry the synced flag
+async def mark_synced(usernames: list[str]):
+    async with SessionLocal() as db:
+        await mark_users_as_synced(db, usernames)
+    await invalidate_profiles(usernames)
+
+
+# create a batch of users through partialImport and map the per-user results back onto the rows
+async def sync_batch(users) -> list[str]:
+    logger.info(f"🔁 Importing {len(users)} users into Keycloak")
+    results = await import_users_to_keycloak(users)
+
+    outcomes = {}
+    for user in users:
+        action = results.get(user.username.lower(), {}).get("action")
+        if action == "ADDED":
+            outcomes[user.username] = "synced"
+        elif action == "SKIPPED":
+            outcomes[user.username] = "skipped"
+        else:
+            outcomes[user.username] = "failed"
+
+    done = [username for username, outcome in outcomes.items() if outcome != "failed"]
+    if done:
+        await mark_synced(done)
+        await add_usernames_to_filter([username for username, outcome in outcomes.items() if outcome == "skipped"])
+    async with SessionLocal() as db:
+        missing = [username for username, outcome in outcomes.items() if outcome == "failed"]
+        if missing:
+            logger.error(f"❌ {len(missing)} users missing from the partialImport result: {missing}")
+            await record_failed_sync_attempts(db, missing, "missing from partialImport result")
+
+    await asyncio.gather(*(
+        send_setup_email(username) for username, outcome in outcomes.items() if outcome == "synced"
+    ))
+    return list(outcomes.values())
 
-    db.close()
 
+# the user exists in Keycloak at this point, so an email failure must not trigger a re-create
+async def send_setup_email(username: str):
+    try:
+        await enqueue_password_email(username)
+    except Exception as e:
+        logger.error(f"❌ Could not queue password setup email for {username}: {e}")
 
 
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, httpx.RequestError):
+        return True
+    if isinstance(error, HTTPException):
+        return error.status_code >= 500 or error.status_code == 429
+    return False
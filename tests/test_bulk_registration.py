@@ -0,0 +1,101 @@
+import json
+from contextlib import asynccontextmanager
+import httpx
+import pytest
+from main import app
+from services import bulk_registration_service
+from utils.profiling import profiler_control
+
+ROWS = 25
+
+
+@pytest.fixture
+def created(monkeypatch):
+    created = {}
+
+    @asynccontextmanager
+    async def session():
+        yield None
+
+    async def insert_users_ignore_existing(db, users):
+        inserted = {user.username for user in users if user.username not in created}
+        for user in users:
+            created.setdefault(user.username, user)
+        return inserted
+
+    async def noop(*args, **kwargs):
+        return None
+
+    async def sample_rate():
+        return 0.0
+
+    monkeypatch.setattr(bulk_registration_service, "SessionLocal", session)
+    monkeypatch.setattr(bulk_registration_service, "insert_users_ignore_existing", insert_users_ignore_existing)
+    monkeypatch.setattr(bulk_registration_service, "add_users_to_filter", noop)
+    monkeypatch.setattr(bulk_registration_service, "invalidate_profiles", noop)
+    # small chunks so results stream back while the body is still being received
+    monkeypatch.setattr(bulk_registration_service, "BULK_CHUNK_SIZE", 2)
+    monkeypatch.setattr(profiler_control, "sample_rate", sample_rate)
+    return created
+
+
+# send the body as many small http.request messages, splitting rows across them
+async def chunked(body: str, size: int = 7):
+    encoded = body.encode()
+    for start in range(0, len(encoded), size):
+        yield encoded[start:start + size]
+
+
+async def post_bulk(body: str, content_type: str) -> list[dict]:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://user-service") as client:
+        response = await client.post("/users/bulk", content=chunked(body), headers={"Content-Type": content_type})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def user_row(i: int) -> dict:
+    return {"username": f"bulk-user-{i}", "email": f"bulk-user-{i}@example.com", "firstName": "Bulk", "lastName": "User"}
+
+
+@pytest.mark.anyio
+async def test_bulk_ndjson_registers_every_row(created):
+    body = "".join(json.dumps(user_row(i)) + "\n" for i in range(ROWS))
+
+    lines = await post_bulk(body, "application/x-ndjson")
+
+    assert lines[-1] == {"summary": {"created": ROWS, "exists": 0, "invalid": 0, "error": 0}}
+    assert [line["status"] for line in lines[:-1]] == ["created"] * ROWS
+    assert set(created) == {f"bulk-user-{i}" for i in range(ROWS)}
+
+
+@pytest.mark.anyio
+async def test_bulk_csv_registers_every_row(created):
+    body = "username,email,firstName,lastName\n" + "".join(
+        "{username},{email},{firstName},{lastName}\n".format(**user_row(i)) for i in range(ROWS)
+    )
+
+    lines = await post_bulk(body, "text/csv")
+
+    assert lines[-1] == {"summary": {"created": ROWS, "exists": 0, "invalid": 0, "error": 0}}
+    assert [line["line"] for line in lines[:-1]] == list(range(2, ROWS + 2))
+    assert set(created) == {f"bulk-user-{i}" for i in range(ROWS)}
+
+
+@pytest.mark.anyio
+async def test_bulk_reports_failed_chunk_and_continues(created, monkeypatch):
+    insert = bulk_registration_service.insert_users_ignore_existing
+
+    async def failing_insert(db, users):
+        if any(user.username == "bulk-user-3" for user in users):
+            raise ConnectionError("connection lost")
+        return await insert(db, users)
+
+    monkeypatch.setattr(bulk_registration_service, "insert_users_ignore_existing", failing_insert)
+    body = "".join(json.dumps(user_row(i)) + "\n" for i in range(ROWS))
+
+    lines = await post_bulk(body, "application/x-ndjson")
+
+    # chunks of two: lines 3 and 4 share the failing chunk
+    assert lines[-1] == {"summary": {"created": ROWS - 2, "exists": 0, "invalid": 0, "error": 2}}
+    assert [line["line"] for line in lines[:-1] if line["status"] == "error"] == [3, 4]
+    assert set(created) == {f"bulk-user-{i}" for i in range(ROWS)} - {"bulk-user-2", "bulk-user-3"}
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+import httpx
+import pytest
+from auth import circuit_breaker
+from auth.circuit_breaker import CircuitBreaker, CircuitOpenError, RetryBudget, ResilientTransport
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=30, half_open_probes=1)
+
+    for _ in range(3):
+        breaker.before_request()
+        breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_request()
+    assert error.value.retry_after == pytest.approx(30)
+
+    clock.now += 30
+    breaker.before_request()
+    assert breaker.state == "half-open"
+    # only one probe at a time while half-open
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_request()
+
+
+def test_failed_probe_reopens_the_circuit(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, half_open_probes=1)
+    breaker.record_failure()
+
+    clock.now += 30
+    breaker.before_request()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+
+
+def test_retry_budget_is_exhausted_and_refills(clock):
+    budget = RetryBudget(ratio=0.5, min_per_second=0.1)
+    assert budget.capacity == 1
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    clock.now += 10
+    assert budget.withdraw()
+
+
+@pytest.mark.anyio
+async def test_cancelled_probe_frees_the_half_open_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=30, half_open_probes=1)
+    breaker.record_failure()
+    clock.now += 30
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.Event().wait()
+
+    transport = ResilientTransport(httpx.MockTransport(hang), breaker, RetryBudget(0.1, 1))
+    probe = asyncio.create_task(transport.handle_async_request(httpx.Request("GET", "http://keycloak.test/")))
+    await started.wait()
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert breaker.state == "half-open"
+    breaker.before_request()
+
+
+@pytest.mark.anyio
+async def test_retries_stop_when_the_budget_is_exhausted(clock):
+    calls = 0
+
+    def unavailable(request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(503)
+
+    breaker = CircuitBreaker(failure_threshold=100, reset_seconds=30, half_open_probes=1)
+    budget = RetryBudget(ratio=0, min_per_second=0)
+    transport = ResilientTransport(httpx.MockTransport(unavailable), breaker, budget)
+
+    first = await transport.handle_async_request(httpx.Request("GET", "http://keycloak.test/"))
+    assert first.status_code == 503
+    assert calls == 2    # one retry, paid for by the bucket's single token
+
+    second = await transport.handle_async_request(httpx.Request("GET", "http://keycloak.test/"))
+    assert second.status_code == 503
+    assert calls == 3    # budget empty: no retry at all
@@ -0,0 +1,95 @@
+import asyncio
+import httpx
+import pytest
+from fastapi import HTTPException
+from auth import keycloak_auth, keycloak_client
+from auth.admin_token import AdminTokenCache
+from auth.circuit_breaker import CircuitBreaker, RetryBudget
+from auth.keycloak_client import KeycloakServerError, start_keycloak_client, close_keycloak_client
+from benchmarks.keycloak_stub import StubConfig, create_keycloak_stub
+from tasks.sync_to_keycloak import is_retryable
+
+TOKEN_PATH = "/realms/master/protocol/openid-connect/token"
+
+
+@pytest.fixture
+def admin_token_cache(monkeypatch):
+    # fresh breaker, retry budget and admin token per test; the client picks them up when it is created
+    monkeypatch.setattr(keycloak_client, "keycloak_breaker", CircuitBreaker(100, 30, 1))
+    monkeypatch.setattr(keycloak_client, "keycloak_retry_budget", RetryBudget(0.1, 1))
+    cache = AdminTokenCache()
+    monkeypatch.setattr(keycloak_auth, "admin_token_cache", cache)
+    return cache
+
+
+async def with_keycloak(transport, operation):
+    await start_keycloak_client(transport)
+    try:
+        return await operation()
+    finally:
+        await close_keycloak_client()
+
+
+def token_response(access_token: str) -> httpx.Response:
+    return httpx.Response(200, json={"access_token": access_token, "expires_in": 300})
+
+
+@pytest.mark.anyio
+async def test_concurrent_callers_share_one_admin_token_request(admin_token_cache):
+    token_requests = 0
+
+    async def handler(request):
+        nonlocal token_requests
+        token_requests += 1
+        await asyncio.sleep(0.01)
+        return token_response("admin-token")
+
+    async def fetch_concurrently():
+        return await asyncio.gather(*(admin_token_cache.get() for _ in range(20)))
+
+    tokens = await with_keycloak(httpx.MockTransport(handler), fetch_concurrently)
+
+    assert tokens == ["admin-token"] * 20
+    assert token_requests == 1
+
+
+@pytest.mark.anyio
+async def test_user_exists_raises_on_keycloak_5xx(admin_token_cache):
+    stub = create_keycloak_stub(StubConfig(admin_error_rate=1))
+
+    with pytest.raises(KeycloakServerError) as error:
+        await with_keycloak(httpx.ASGITransport(app=stub), lambda: keycloak_auth.keycloak_user_exists("nobody"))
+
+    assert error.value.status_code == 503
+    assert is_retryable(error.value)
+    assert keycloak_client.keycloak_unavailable(error.value).status_code == 503
+
+
+@pytest.mark.anyio
+async def test_user_exists_renews_a_rejected_admin_token(admin_token_cache):
+    issued = iter(["revoked-token", "fresh-token"])
+
+    def handler(request):
+        if request.url.path == TOKEN_PATH:
+            return token_response(next(issued))
+        if request.headers["Authorization"] == "Bearer revoked-token":
+            return httpx.Response(401, json={"error": "HTTP 401 Unauthorized"})
+        return httpx.Response(200, json=[])
+
+    exists = await with_keycloak(httpx.MockTransport(handler), lambda: keycloak_auth.keycloak_user_exists("nobody"))
+
+    assert exists is False
+
+
+@pytest.mark.anyio
+async def test_user_exists_raises_on_persistent_401(admin_token_cache):
+    def handler(request):
+        if request.url.path == TOKEN_PATH:
+            return token_response("admin-token")
+        return httpx.Response(401, json={"error": "HTTP 401 Unauthorized"})
+
+    with pytest.raises(HTTPException) as error:
+        await with_keycloak(httpx.MockTransport(handler), lambda: keycloak_auth.keycloak_user_exists("nobody"))
+
+    assert error.value.status_code == 502
+    assert is_retryable(error.value)
@@ -0,0 +1,48 @@
+import pytest
+from fakeredis import FakeAsyncRedis
+from redis_cache import user_filter
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    redis = FakeAsyncRedis()
+    monkeypatch.setattr(user_filter, "redis_client", redis)
+    return redis
+
+
+@pytest.mark.anyio
+async def test_cold_filter_answers_maybe(redis):
+    await user_filter.add_user_to_filter("alice", "alice@example.com")
+
+    assert await user_filter.might_exist("bob", "bob@example.com") == (True, True)
+
+
+@pytest.mark.anyio
+async def test_username_miss_is_trusted_only_after_keycloak_load(redis):
+    await redis.set(user_filter.WARM_KEY, 1)
+    await user_filter.add_user_to_filter("alice", "alice@example.com")
+
+    # Postgres-only warmth: emails can be ruled out, usernames still need the Keycloak check
+    assert await user_filter.might_exist("bob", "bob@example.com") == (True, False)
+    assert await user_filter.might_exist("Alice", "ALICE@example.com") == (True, True)
+
+    await user_filter.add_usernames_to_filter(["carol"])
+    await user_filter.mark_keycloak_usernames_loaded()
+
+    assert await user_filter.might_exist("bob", "bob@example.com") == (False, False)
+    assert await user_filter.might_exist("carol", "carol@example.com") == (True, False)
+    assert await user_filter.might_exist("alice", "alice@example.com") == (True, True)
+
+
+@pytest.mark.anyio
+async def test_failed_add_marks_the_filter_cold(redis, monkeypatch):
+    await redis.set(user_filter.WARM_KEY, 1)
+    await redis.set(user_filter.KEYCLOAK_WARM_KEY, 1)
+
+    def broken_pipeline(*args, **kwargs):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(redis, "pipeline", broken_pipeline)
+    await user_filter.add_usernames_to_filter(["dave"])
+
+    assert not await redis.exists(user_filter.WARM_KEY, user_filter.KEYCLOAK_WARM_KEY)
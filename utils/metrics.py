@@ -0,0 +1,88 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Prometheus metrics shared across the service, exposed on GET /metrics
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Latency of handled HTTP requests",
+    ["method", "route", "status"],
+)
+
+KEYCLOAK_REQUEST_SECONDS = Histogram(
+    "keycloak_request_duration_seconds",
+    "Latency of outbound Keycloak calls, retries included",
+    ["operation"],
+)
+KEYCLOAK_REQUEST_ERRORS = Counter(
+    "keycloak_request_errors_total",
+    "Outbound Keycloak calls that failed or returned 5xx",
+    ["operation", "error"],
+)
+
+RATE_LIMITED_REQUESTS = Counter(
+    "rate_limited_requests_total",
+    "Requests rejected with 429 by the per-client rate limiter",
+    ["route", "scope"],
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_duration_seconds",
+    "Time spent waiting for a pooled Postgres connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Postgres statement execution time",
+    ["statement"],
+)
+
+REDIS_COMMAND_SECONDS = Histogram(
+    "redis_command_duration_seconds",
+    "Redis command round-trip time (pipelines are reported as PIPELINE)",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+REGISTRATION_BUFFER_PENDING = Gauge(
+    "registration_buffer_pending",
+    "Buffered registrations not yet flushed to Postgres",
+    multiprocess_mode="max",
+)
+REGISTRATION_BUFFER_LAG_SECONDS = Gauge(
+    "registration_buffer_lag_seconds",
+    "Age of the oldest buffered registration",
+    multiprocess_mode="max",
+)
+REGISTRATION_FLUSHED = Counter(
+    "registration_flushed_total",
+    "Buffered registrations written to Postgres",
+    ["outcome"],
+)
+
+SYNC_BACKLOG_USERS = Gauge(
+    "sync_backlog_users",
+    "Users in Postgres not yet synced to Keycloak",
+    multiprocess_mode="max",
+)
+SYNC_OLDEST_UNSYNCED_SECONDS = Gauge(
+    "sync_oldest_unsynced_age_seconds",
+    "Age of the oldest unsynced user",
+    multiprocess_mode="max",
+)
+SYNC_DEAD_LETTER_USERS = Gauge(
+    "sync_dead_letter_users",
+    "Unsynced users that reached SYNC_MAX_ATTEMPTS and are no longer retried",
+    multiprocess_mode="max",
+)
+SYNC_LEADER = Gauge(
+    "sync_leader",
+    "1 while this process holds the sync leadership lock",
+    multiprocess_mode="livesum",
+)
+SYNC_RUN_SECONDS = Histogram(
+    "sync_run_duration_seconds",
+    "Duration of a Keycloak sync run",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+SYNC_USERS = Counter("sync_users_total", "Users processed by the Keycloak sync", ["outcome"])
+
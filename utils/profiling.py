@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from fastapi import Request
+from redis_cache.client import redis_client
+from utils.timeline import start_timeline, end_timeline
+from logs.logging_config import request_id_var
+from config.settings import (
+    SLOW_REQUEST_THRESHOLD_MS,
+    PROFILER_MAX_CAPTURES,
+    PROFILER_CAPTURE_TTL_SECONDS,
+    PROFILER_INTERVAL_SECONDS,
+    PROFILER_PROFILE_SLOW_REQUESTS,
+)
+
+try:
+    from pyinstrument import Profiler
+except ImportError:    # optional: without it captures carry only the timeline
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# sample rate set through /admin/profiler/enable, shared by every worker and expiring on its own
+STATE_KEY = "user-service:profiler:sample-rate"
+CAPTURES_KEY = "user-service:profiler:captures"
+CAPTURE_KEY_PREFIX = "user-service:profiler:capture:"
+PROFILE_KEY_PREFIX = "user-service:profiler:profile:"
+# how often each worker re-reads the sample rate from redis
+STATE_REFRESH_SECONDS = 2
+
+
+class ProfilerControl:
+    """
+    Per-worker view of the profiling switch. pyinstrument profiles one request at a time
+    per thread, so a sampled request is skipped while another one is being profiled.
+    """
+
+    def __init__(self):
+        self._sample_rate = 0.0
+        self._checked_at = 0.0
+        self._busy = False
+        self._saving = set()
+
+    async def sample_rate(self) -> float:
+        now = time.monotonic()
+        if now - self._checked_at >= STATE_REFRESH_SECONDS:
+            self._checked_at = now
+            try:
+                raw = await redis_client.get(STATE_KEY)
+                self._sample_rate = float(raw) if raw else 0.0
+            except Exception as e:
+                logger.warning(f"Could not read profiler state: {e}")
+                self._sample_rate = 0.0
+        return self._sample_rate
+
+    # returns (profiler or None, whether the request was sampled)
+    async def start_profiler(self):
+        if Profiler is None or self._busy:
+            return None, False
+        sampled = random.random() < await self.sample_rate()
+        if not sampled and not (PROFILER_PROFILE_SLOW_REQUESTS and SLOW_REQUEST_THRESHOLD_MS):
+            return None, False
+        self._busy = True
+        profiler = Profiler(interval=PROFILER_INTERVAL_SECONDS, async_mode="enabled")
+        profiler.start()
+        return profiler, sampled
+
+    def stop_profiler(self, profiler):
+        profiler.stop()
+        self._busy = False
+
+    # captures are rendered and written off the response path
+    def save_in_background(self, capture: dict, profiler):
+        task = asyncio.create_task(save_capture(capture, profiler))
+        self._saving.add(task)
+        task.add_done_callback(self._saving.discard)
+
+
+profiler_control = ProfilerControl()
+
+
+# profile a sampled fraction of requests and keep a capture of every slow one
+async def profile_request(request: Request, call_next):
+    profiler, sampled = await profiler_control.start_profiler()
+    timeline, token = start_timeline()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        ended = time.perf_counter()
+        end_timeline(token)
+        if profiler is not None:
+            profiler_control.stop_profiler(profiler)
+
+        duration_ms = (ended - started) * 1000
+        slow = SLOW_REQUEST_THRESHOLD_MS and duration_ms >= SLOW_REQUEST_THRESHOLD_MS
+        if profiler is not None and not (slow or sampled):
+            profiler = None    # profiled only in case it turned out slow
+        if slow or profiler is not None:
+            capture = {
+                "id": uuid.uuid4().hex,
+                "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "reason": "slow" if slow else "sampled",
+                "method": request.method,
+                "path": request.url.path,
+                "status": status_code,
+                "duration_ms": round(duration_ms, 2),
+                "request_id": request_id_var.get(),
+                "has_profile": profiler is not None,
+                "timeline": [
+                    {
+                        "kind": kind,
+                        "name": name,
+                        "start_ms": round((span_started - started) * 1000, 2),
+                        "duration_ms": round((span_ended - span_started) * 1000, 2),
+                    }
+                    for kind, name, span_started, span_ended in timeline
+                ],
+            }
+            profiler_control.save_in_background(capture, profiler)
+
+
+async def save_capture(capture: dict, profiler):
+    try:
+        profile_html = await asyncio.to_thread(profiler.output_html) if profiler is not None else None
+        summary = {key: value for key, value in capture.items() if key != "timeline"}
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(f"{CAPTURE_KEY_PREFIX}{capture['id']}", json.dumps(capture), ex=PROFILER_CAPTURE_TTL_SECONDS)
+            if profile_html is not None:
+                pipe.set(f"{PROFILE_KEY_PREFIX}{capture['id']}", profile_html, ex=PROFILER_CAPTURE_TTL_SECONDS)
+            pipe.lpush(CAPTURES_KEY, json.dumps(summary))
+            pipe.ltrim(CAPTURES_KEY, 0, PROFILER_MAX_CAPTURES - 1)
+            await pipe.execute()
+        logger.info("🐢 Captured %s request %s %s (%.0fms)", capture["reason"], capture["method"], capture["path"], capture["duration_ms"])
+    except Exception as e:
+        logger.warning(f"Could not store profiler capture: {e}")
+
+
+async def enable_profiling(sample_rate: float, duration_seconds: int):
+    await redis_client.set(STATE_KEY, sample_rate, ex=duration_seconds)
+
+
+async def disable_profiling():
+    await redis_client.delete(STATE_KEY)
+
+
+async def list_captures() -> list[dict]:
+    return [json.loads(raw) for raw in await redis_client.lrange(CAPTURES_KEY, 0, PROFILER_MAX_CAPTURES - 1)]
+
+
+async def get_capture(capture_id: str) -> dict | None:
+    raw = await redis_client.get(f"{CAPTURE_KEY_PREFIX}{capture_id}")
+    return json.loads(raw) if raw else None
+
+
+async def get_capture_profile(capture_id: str) -> str | None:
+    raw = await redis_client.get(f"{PROFILE_KEY_PREFIX}{capture_id}")
+    return raw.decode() if raw else None
@@ -0,0 +1,23 @@
+import time
+from contextvars import ContextVar
+
+# outbound calls (keycloak, postgres, redis) made while handling the current request;
+# None outside requests, so recording is a single contextvar lookup when nobody listens
+_timeline: ContextVar[list | None] = ContextVar("request_timeline", default=None)
+
+MAX_SPANS = 500
+
+
+def start_timeline() -> tuple[list, object]:
+    timeline = []
+    return timeline, _timeline.set(timeline)
+
+
+def end_timeline(token):
+    _timeline.reset(token)
+
+
+def record_span(kind: str, name: str, started: float, ended: float | None = None):
+    timeline = _timeline.get()
+    if timeline is not None and len(timeline) < MAX_SPANS:
+        timeline.append((kind, name, started, ended if ended is not None else time.perf_counter()))